@@ -7,7 +7,8 @@ from .models import (
     LeaderboardEntry,
     DailyChallenge,
     Lobby,
-    GameSession
+    GameSession,
+    Job
 )
 
 # ---------------------------
@@ -84,3 +85,13 @@ class GameSessionAdmin(admin.ModelAdmin):
     search_fields = ['lobby__name', 'quiz__title']
     readonly_fields = ['started_at', 'completed_at']
 
+
+# ---------------------------
+# Job Admin
+# ---------------------------
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'duration_seconds', 'locked_by']
+    search_fields = ['name', 'dedupe_key']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'duration_seconds']
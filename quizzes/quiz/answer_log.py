@@ -0,0 +1,341 @@
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from .models import AnswerLogCheckpoint, AttemptAnswer, QuizAttempt, Question
+
+# Append-only answer event log.
+# With ANSWER_LOG_ENABLED, answers are acknowledged once they are appended (and,
+# with ANSWER_LOG_FSYNC, fsynced in small batches) to a per-process segmented
+# log under ANSWER_LOG_DIR/<writer>/. `manage.py project_answers` applies the
+# events to AttemptAnswer/QuizAttempt in bulk; the per-writer checkpoint is
+# stored in the same transaction, so a crash at any point replays exactly the
+# events that were not applied yet.
+#
+# Segment files are named after the first sequence number they hold, and each
+# line is "<crc32 hex> <json>\n"; a torn or corrupt tail is cut off on recovery.
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+
+def segment_name(first_seq):
+    return f'{SEGMENT_PREFIX}{first_seq:012d}{SEGMENT_SUFFIX}'
+
+
+def segment_first_seq(path):
+    return int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def list_segments(directory):
+    return sorted(Path(directory).glob(f'{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}'), key=segment_first_seq)
+
+
+def encode_line(record):
+    body = json.dumps(record, separators=(',', ':'), sort_keys=True).encode()
+    return b'%08x %s\n' % (zlib.crc32(body), body)
+
+
+def decode_line(line):
+    """The record on one complete line, or None if it is torn or corrupt."""
+    if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b' ':
+        return None
+    body = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(body):
+            return None
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def read_segment(path):
+    """Yield (offset_after_line, record) for every valid line, stopping at the first bad one."""
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            record = decode_line(line)
+            if record is None:
+                return
+            offset += len(line)
+            yield offset, record
+
+
+def read_records(directory, after_seq=0, limit=None):
+    """Records with seq > after_seq from one writer's segments, in order."""
+    segments = list_segments(directory)
+    records = []
+    for i, path in enumerate(segments):
+        # skip segments that end before the checkpoint
+        if i + 1 < len(segments) and segment_first_seq(segments[i + 1]) <= after_seq + 1:
+            continue
+        for _, record in read_segment(path):
+            if record['seq'] > after_seq:
+                records.append(record)
+                if limit is not None and len(records) >= limit:
+                    return records
+    return records
+
+
+class AnswerLog:
+    """One process's writer: appends are serialized, fsyncs are shared by every append in a batch."""
+
+    def __init__(self, directory, segment_bytes, fsync=True, fsync_interval=0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.cond = threading.Condition()
+        self.seq = self._recover()
+        self.synced = self.seq
+        self._flusher = None
+
+    def _recover(self):
+        segments = list_segments(self.directory)
+        if not segments:
+            self._open(1)
+            return 0
+        path = segments[-1]
+        last_seq, good = segment_first_seq(path) - 1, 0
+        for offset, record in read_segment(path):
+            last_seq, good = record['seq'], offset
+        # cut off a torn write left by a crash before appending after it
+        with open(path, 'r+b') as f:
+            f.truncate(good)
+        self.path = path
+        self.file = open(path, 'ab')
+        return last_seq
+
+    def _open(self, first_seq):
+        self.path = self.directory / segment_name(first_seq)
+        self.file = open(self.path, 'ab')
+        self._sync_dir()
+
+    def _sync_dir(self):
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.directory, os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _rotate(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.synced = self.seq
+        self.file.close()
+        self._open(self.seq + 1)
+
+    def append(self, record):
+        """Write one record and return its sequence number once it is durable."""
+        with self.cond:
+            self.seq += 1
+            seq = self.seq
+            self.file.write(encode_line(dict(record, seq=seq)))
+            if not self.fsync:
+                self.file.flush()
+                self.synced = seq
+            elif self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='answer-log-fsync', daemon=True)
+                self._flusher.start()
+            self.cond.notify_all()
+            while self.synced < seq:
+                self.cond.wait()
+            if self.file.tell() >= self.segment_bytes:
+                self._rotate()
+        return seq
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                while self.synced >= self.seq:
+                    self.cond.wait()
+            # appends arriving during an fsync share the next one; optionally wait for more
+            if self.fsync_interval:
+                time.sleep(self.fsync_interval)
+            with self.cond:
+                target = self.seq
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.synced = max(self.synced, target)
+                self.cond.notify_all()
+
+
+def writer_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = AnswerLog(
+                Path(settings.ANSWER_LOG_DIR) / writer_name(),
+                settings.ANSWER_LOG_SEGMENT_BYTES,
+                fsync=settings.ANSWER_LOG_FSYNC,
+                fsync_interval=settings.ANSWER_LOG_FSYNC_INTERVAL,
+            )
+        return _log
+
+
+def append_answer(attempt_id, question_id, selected_answer, is_correct):
+    return get_log().append({
+        'attempt_id': attempt_id,
+        'question_id': int(question_id),
+        'selected_answer': selected_answer,
+        'is_correct': bool(is_correct),
+        'ts': time.time(),
+    })
+
+
+# -- projection -------------------------------------------------------------
+
+def writer_dirs():
+    root = Path(settings.ANSWER_LOG_DIR)
+    if not root.exists():
+        return []
+    return sorted(p for p in root.iterdir() if p.is_dir())
+
+
+def checkpoints():
+    return dict(AnswerLogCheckpoint.objects.values_list('writer', 'seq'))
+
+
+def apply_batch(writer, records):
+    """Apply records to the tables and move the writer's checkpoint, all in one transaction."""
+    with transaction.atomic():
+        checkpoint, _ = AnswerLogCheckpoint.objects.select_for_update().get_or_create(writer=writer)
+        records = [r for r in records if r['seq'] > checkpoint.seq]
+        if not records:
+            return 0
+        # attempts or questions deleted since the answer was logged are skipped
+        attempt_ids = set(QuizAttempt.objects.filter(
+            pk__in={r['attempt_id'] for r in records}).values_list('id', flat=True))
+        question_ids = set(Question.objects.filter(
+            pk__in={r['question_id'] for r in records}).values_list('id', flat=True))
+        rows = [
+            AttemptAnswer(attempt_id=r['attempt_id'], question_id=r['question_id'],
+                          selected_answer=r['selected_answer'], is_correct=r['is_correct'],
+                          log_writer=writer, log_seq=r['seq'])
+            for r in records if r['attempt_id'] in attempt_ids and r['question_id'] in question_ids
+        ]
+        AttemptAnswer.objects.bulk_create(rows, batch_size=500)
+
+        # the score is derived from the answers, so replays and late projections can't double count
+        touched = {row.attempt_id for row in rows}
+        scores = (
+            AttemptAnswer.objects.filter(attempt_id__in=touched).values('attempt_id')
+            .annotate(correct=Count('id', filter=Q(is_correct=True)))
+        )
+        attempts = [QuizAttempt(pk=row['attempt_id'], score=row['correct']) for row in scores]
+        QuizAttempt.objects.bulk_update(attempts, ['score'], batch_size=500)
+
+        checkpoint.seq = records[-1]['seq']
+        checkpoint.save()
+        return len(records)
+
+
+def project(batch_size=1000):
+    """Apply every writer's unprojected events; returns how many were applied."""
+    applied = 0
+    done = checkpoints()
+    for directory in writer_dirs():
+        after = done.get(directory.name, 0)
+        while True:
+            records = read_records(directory, after, limit=batch_size)
+            if not records:
+                break
+            applied += apply_batch(directory.name, records)
+            after = records[-1]['seq']
+        prune_segments(directory, after)
+    return applied
+
+
+def prune_segments(directory, checkpoint):
+    """Delete segments fully covered by the checkpoint, never the newest (the writer may be appending)."""
+    segments = list_segments(directory)
+    for path, following in zip(segments, segments[1:]):
+        if segment_first_seq(following) - 1 <= checkpoint:
+            path.unlink(missing_ok=True)
+
+
+class PendingIndex:
+    """Every writer's unprojected records, by attempt, kept up to date by reading only what was appended
+    since the last look (so a page view doesn't re-read the log)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions = {}  # writer directory -> (first seq of the segment being read, offset read up to)
+        self.by_attempt = defaultdict(list)
+        self.done = {}
+
+    def pending(self, attempt_id, done):
+        """Records of the attempt past the `done` checkpoints, each with its 'writer'."""
+        with self.lock:
+            if done != self.done:
+                self._prune(done)
+            for directory in writer_dirs():
+                self._tail(directory, done.get(directory.name, 0))
+            return list(self.by_attempt.get(attempt_id, ()))
+
+    def _prune(self, done):
+        self.done = done
+        for attempt_id in list(self.by_attempt):
+            kept = [r for r in self.by_attempt[attempt_id] if r['seq'] > done.get(r['writer'], 0)]
+            if kept:
+                self.by_attempt[attempt_id] = kept
+            else:
+                del self.by_attempt[attempt_id]
+
+    def _tail(self, directory, after_seq):
+        segments = list_segments(directory)
+        if not segments:
+            return
+        position = self.positions.get(str(directory))
+        if position is None:
+            # first look at this writer: start at the segment holding the checkpoint
+            start = max([i for i, path in enumerate(segments) if segment_first_seq(path) <= after_seq + 1] or [0])
+            position = (segment_first_seq(segments[start]), 0)
+        first, offset = position
+        for path in segments:
+            if segment_first_seq(path) < first:
+                continue
+            if segment_first_seq(path) > first:
+                # on to the next segment; if ours was pruned, what was left of it is projected
+                first, offset = segment_first_seq(path), 0
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(offset)
+                for line in f:
+                    record = decode_line(line)
+                    if record is None:
+                        # the writer is mid-line; read it next time
+                        break
+                    offset += len(line)
+                    if record['seq'] > after_seq:
+                        self.by_attempt[record['attempt_id']].append(dict(record, writer=directory.name))
+        self.positions[str(directory)] = (first, offset)
+
+
+_pending = PendingIndex()
+
+
+def pending_answers(attempt_id, done=None):
+    """Logged answers for one attempt that haven't been projected past the `done` checkpoints yet."""
+    return _pending.pending(attempt_id, checkpoints() if done is None else done)
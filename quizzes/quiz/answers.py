@@ -0,0 +1,49 @@
+from django.conf import settings
+from . import answer_log
+from .models import AttemptAnswer
+
+# The single write/read path for attempt answers. With ANSWER_LOG_ENABLED the
+# answer is appended to the answer log and projected into AttemptAnswer later,
+# so readers merge in the answers that are still only in the log.
+
+
+def record_answer(attempt, question_id, selected_answer, is_correct):
+    """Store one answer and bump attempt.score; returns the AttemptAnswer (unsaved when logged)."""
+    answer = AttemptAnswer(
+        attempt=attempt,
+        question_id=question_id,
+        selected_answer=selected_answer,
+        is_correct=is_correct
+    )
+    if settings.ANSWER_LOG_ENABLED:
+        answer_log.append_answer(attempt.id, question_id, selected_answer, is_correct)
+        # the projector recomputes the stored score from the answers
+        if is_correct:
+            attempt.score += 1
+        return answer
+
+    answer.save()
+    if is_correct:
+        attempt.score += 1
+        attempt.save()
+    return answer
+
+
+def attempt_answers(attempt_id):
+    """[(question_id, is_correct)] for every answer in the attempt, in the order they were given."""
+    rows = AttemptAnswer.objects.filter(attempt_id=attempt_id).order_by('id')
+    if not settings.ANSWER_LOG_ENABLED:
+        return list(rows.values_list('question_id', 'is_correct'))
+
+    # checkpoints before rows: an answer projected in between is then in both, and is told apart
+    # by its log position, instead of in neither
+    pending = answer_log.pending_answers(attempt_id, answer_log.checkpoints())
+    rows = list(rows.values_list('question_id', 'is_correct', 'log_writer', 'log_seq'))
+    projected = {(writer, seq) for _, _, writer, seq in rows if seq is not None}
+    return [(question_id, is_correct) for question_id, is_correct, _, _ in rows] + [
+        (r['question_id'], r['is_correct']) for r in pending if (r['writer'], r['seq']) not in projected
+    ]
+
+
+def attempt_score(attempt_id):
+    return sum(1 for _, is_correct in attempt_answers(attempt_id) if is_correct)
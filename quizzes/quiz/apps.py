@@ -3,3 +3,9 @@ from django.apps import AppConfig
 class QuizConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quiz'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registers cache invalidation handlers)
+        from . import tasks  # noqa: F401  (registers background jobs)
+        from . import instrumentation
+        instrumentation.configure()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from collections import OrderedDict
+from itertools import count
+from . import metrics
+
+# Per-connection limits for LobbyConsumer: a token bucket for inbound frames and a
+# bounded outbound queue that merges score frames when a client falls behind.
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.updated = clock()
+
+    def allow(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class Outbox:
+    """Bounded queue of events waiting to be sent to one client.
+
+    A score_update for a user who already has one queued replaces it in place (merged),
+    since the newer frame carries the user's latest score. When the queue is full the
+    oldest frame is dropped.
+    """
+
+    def __init__(self, maxsize, lobby_id):
+        self.maxsize = maxsize
+        self.lobby_id = lobby_id
+        self._events = OrderedDict()
+        self._ids = count()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._events)
+
+    def push(self, event):
+        if event.get('type') == 'score_update':
+            key = ('score', event.get('user_id'))
+            if key in self._events:
+                self._events[key] = event
+                metrics.incr_lobby(self.lobby_id, 'merged')
+                return
+        else:
+            key = ('event', next(self._ids))
+
+        if len(self._events) >= self.maxsize:
+            self._events.popitem(last=False)
+            metrics.incr_lobby(self.lobby_id, 'dropped')
+        self._events[key] = event
+        self._ready.set()
+
+    async def pop(self):
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._events.popitem(last=False)[1]
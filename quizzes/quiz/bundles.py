@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from . import jobs
+from .models import Quiz, Question
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishes are then only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Static quiz bundles.
+# Every public quiz is written to STATIC_ROOT/quizzes/quiz-<id>.<hash>.json
+# (questions without answers), and STATIC_ROOT/quizzes/catalogue.json lists the
+# current bundle of each quiz. Bundle names change whenever their content does,
+# so the web server/CDN can cache them forever:
+#
+#   location /static/quizzes/ {
+#       location ~ \.[0-9a-f]{12}\.json$ { add_header Cache-Control "public, max-age=31536000, immutable"; }
+#       location = /static/quizzes/catalogue.json { add_header Cache-Control "public, max-age=60"; }
+#   }
+#
+# Bundles are republished after commit whenever a quiz or question changes
+# (see quiz/signals.py), by a background job if QUIZ_BUNDLES_PUBLISH_IN_BACKGROUND
+# is set, or in full with `manage.py publish_quizzes`. Every catalogue
+# read-modify-write holds catalogue_lock(), so concurrent publishes from several
+# workers don't drop each other's entries.
+
+CATALOGUE = 'catalogue.json'
+BUNDLE_RE = re.compile(r'^quiz-(?P<quiz_id>\d+)\.(?P<hash>[0-9a-f]{12})\.json$')
+QUESTION_FIELDS = ['id', 'text', 'question_type', 'option_a', 'option_b', 'option_c', 'option_d']
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CATALOGUE_CACHE_CONTROL = 'public, max-age=60'
+
+# with DEBUG, runserver answers everything under STATIC_URL from the staticfiles finders,
+# which never look in STATIC_ROOT; bundles are served by quiz.views.quiz_bundle here instead
+DEV_URL_PREFIX = '/dev/quizzes/'
+
+
+def bundle_dir():
+    return Path(settings.STATIC_ROOT) / 'quizzes'
+
+
+def bundle_url(name):
+    if settings.DEBUG:
+        return f'{DEV_URL_PREFIX}{name}'
+    return f'{settings.STATIC_URL}quizzes/{name}'
+
+
+def encode(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode()
+
+
+def write_atomic(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def build_bundle(quiz):
+    return {
+        'id': quiz.id,
+        'title': quiz.title,
+        'is_timed': quiz.is_timed,
+        'time_limit_seconds': quiz.time_limit_seconds,
+        'pool_size': quiz.pool_size,
+        'created_at': quiz.created_at.isoformat(),
+        'questions': list(Question.objects.filter(quiz_id=quiz.id).order_by('id').values(*QUESTION_FIELDS)),
+    }
+
+
+def write_bundle(quiz):
+    """Write the quiz's bundle if its content changed; return its catalogue entry."""
+    bundle = build_bundle(quiz)
+    content = encode(bundle)
+    name = f'quiz-{quiz.id}.{hashlib.sha256(content).hexdigest()[:12]}.json'
+    path = bundle_dir() / name
+    if not path.exists():
+        write_atomic(path, content)
+    return {
+        'id': quiz.id,
+        'title': quiz.title,
+        'question_count': len(bundle['questions']),
+        'bundle': bundle_url(name),
+    }
+
+
+def read_catalogue():
+    """{quiz_id: catalogue entry}, or None if nothing has been published yet."""
+    try:
+        with open(bundle_dir() / CATALOGUE, 'rb') as f:
+            return {entry['id']: entry for entry in json.load(f)['quizzes']}
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def write_catalogue(entries):
+    quizzes = sorted(entries.values(), key=lambda entry: entry['id'])
+    write_atomic(bundle_dir() / CATALOGUE, encode({'quizzes': quizzes}))
+
+
+_thread_lock = threading.Lock()
+
+
+@contextmanager
+def catalogue_lock():
+    """Exclusive across threads and (where flock exists) processes sharing STATIC_ROOT."""
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        bundle_dir().mkdir(parents=True, exist_ok=True)
+        with open(bundle_dir() / '.catalogue.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def remove_stale_bundles(quiz_id):
+    for path in bundle_dir().glob(f'quiz-{quiz_id}.*.json'):
+        path.unlink(missing_ok=True)
+
+
+def publish_quiz(quiz_id):
+    """Bring one quiz's bundle and catalogue entry up to date.
+
+    Without a catalogue yet, a full publish is queued instead (see the publish_all_bundles job)
+    rather than run here, which may be inside a request.
+    """
+    with catalogue_lock():
+        catalogue = read_catalogue()
+        if catalogue is None:
+            jobs.enqueue('publish_all_bundles', dedupe_key='publish-all-bundles')
+            return
+        # read under the lock too: a publish that saw an older version of the quiz must not win
+        quiz = Quiz.objects.filter(pk=quiz_id, is_public=True).first()
+        if quiz is not None:
+            catalogue[quiz_id] = write_bundle(quiz)
+        else:
+            catalogue.pop(quiz_id, None)
+        write_catalogue(catalogue)
+        if quiz is None:
+            # hidden or deleted quizzes disappear at once; superseded bundles of live quizzes are
+            # kept until the next full publish so clients holding the old catalogue don't 404
+            remove_stale_bundles(quiz_id)
+
+
+def publish_all(prune=True):
+    """Write every public quiz's bundle and a fresh catalogue; optionally delete unreferenced bundles."""
+    # held throughout, so a quiz published meanwhile can't be overwritten with what was read before it
+    with catalogue_lock():
+        catalogue = {}
+        for quiz in Quiz.objects.filter(is_public=True).order_by('id').iterator():
+            catalogue[quiz.id] = write_bundle(quiz)
+        write_catalogue(catalogue)
+
+        removed = 0
+        if prune:
+            # by name: the catalogue's URLs depend on DEBUG (see DEV_URL_PREFIX)
+            current = {entry['bundle'].rsplit('/', 1)[-1] for entry in catalogue.values()}
+            for path in bundle_dir().glob('quiz-*.json'):
+                if BUNDLE_RE.match(path.name) and path.name not in current:
+                    path.unlink(missing_ok=True)
+                    removed += 1
+    return catalogue, removed
+
+
+_local = threading.local()
+
+
+def schedule_publish(quiz_id):
+    """Republish a quiz once the current transaction commits (once per quiz, however many rows changed)."""
+    if not settings.QUIZ_BUNDLES_AUTO_PUBLISH:
+        return
+    if settings.QUIZ_BUNDLES_PUBLISH_IN_BACKGROUND:
+        # queued in the same transaction as the change, so the job can't run before (or without) it
+        jobs.enqueue('publish_quiz_bundle', {'quiz_id': quiz_id}, dedupe_key=f'publish-quiz:{quiz_id}')
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is None or not transaction.get_connection().run_on_commit:
+        # nothing queued on this connection: earlier callbacks ran or were rolled back
+        pending = _local.pending = set()
+    if quiz_id in pending:
+        return
+    pending.add(quiz_id)
+
+    def run():
+        pending.discard(quiz_id)
+        try:
+            publish_quiz(quiz_id)
+        except OSError:
+            # the write is already committed; a full publish_quizzes run will catch up
+            logger.exception('could not publish bundle for quiz %s', quiz_id)
+
+    transaction.on_commit(run)
@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core.cache import cache
+from . import projections
+from .models import Quiz, Question
+from .routers import primary
+
+# Cached read models for the hot paths. Entries are dropped by the signal
+# handlers in quiz/signals.py once a change to the underlying rows commits, and
+# can be preloaded with quiz.warmup.warm(). The cache is shared by all workers
+# (see CACHES in settings), so a drop in one process is seen by every other.
+#
+# Entries are always built from the primary: one built from a lagging replica
+# right after a drop would serve the old rows until it expires. So the replicas
+# only take the uncached reads of replica-enabled views; cache misses go to the
+# primary, which is cheap as long as misses are rare next to hits.
+
+MISSING = object()
+
+
+def quiz_key(quiz_id):
+    return f'quiz:payload:{quiz_id}'
+
+
+def answers_key(quiz_id):
+    return f'quiz:answers:{quiz_id}'
+
+
+def leaderboard_key(quiz_id):
+    return f'quiz:leaderboard:{quiz_id}'
+
+
+def daily_key(date):
+    return f'quiz:daily:{date.isoformat()}'
+
+
+def build_quiz_payloads(quiz_ids):
+    with primary():
+        return projections.quiz_payloads(quiz_ids)
+
+
+def quiz_payload(quiz_id):
+    """Serialized quiz with its questions, or None if it doesn't exist."""
+    payload = cache.get(quiz_key(quiz_id), MISSING)
+    if payload is MISSING:
+        payload = build_quiz_payloads([quiz_id]).get(quiz_id)
+        if payload is None:
+            return None
+        cache.set(quiz_key(quiz_id), payload, settings.QUIZ_CACHE_TIMEOUT)
+    return payload
+
+
+def _quiz_payload_batch(ids):
+    cached = cache.get_many([quiz_key(i) for i in ids])
+    missing = [i for i in ids if quiz_key(i) not in cached]
+    if missing:
+        fresh = {quiz_key(quiz_id): payload for quiz_id, payload in build_quiz_payloads(missing).items()}
+        cache.set_many(fresh, settings.QUIZ_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [cached[quiz_key(i)] for i in ids if quiz_key(i) in cached]
+
+
+def iter_public_quiz_payloads(batch_size=200):
+    """Public quiz payloads, loaded (and cached) a batch at a time."""
+    ids = list(Quiz.objects.filter(is_public=True).values_list('id', flat=True))
+    for offset in range(0, len(ids), batch_size):
+        yield from _quiz_payload_batch(ids[offset:offset + batch_size])
+
+
+def public_quiz_payloads():
+    return list(iter_public_quiz_payloads())
+
+
+def build_answer_key(quiz_id):
+    return {
+        question_id: (correct or '').strip().lower()
+        for question_id, correct in (
+            Question.objects.using('default').filter(quiz_id=quiz_id).values_list('id', 'correct_answer')
+        )
+    }
+
+
+def answer_key(quiz_id):
+    """{question_id: normalized correct answer} for one quiz.
+
+    May briefly lack a question added in the last moments; callers fall back to correct_answer().
+    """
+    key = cache.get(answers_key(quiz_id))
+    if key is None:
+        key = build_answer_key(quiz_id)
+        cache.set(answers_key(quiz_id), key, settings.QUIZ_CACHE_TIMEOUT)
+    return key
+
+
+def correct_answer(quiz_id, question_id):
+    """Normalized correct answer of one question, from the cached key or else the primary.
+
+    Raises Question.DoesNotExist if the question is not in the quiz.
+    """
+    answer = answer_key(quiz_id).get(question_id)
+    if answer is None:
+        correct = Question.objects.using('default').values_list('correct_answer', flat=True).get(
+            pk=question_id, quiz_id=quiz_id)
+        answer = (correct or '').strip().lower()
+    return answer
+
+
+def build_leaderboard(quiz_id):
+    with primary():
+        return list(projections.leaderboard_rows(quiz_id))
+
+
+def leaderboard(quiz_id):
+    data = cache.get(leaderboard_key(quiz_id))
+    if data is None:
+        data = build_leaderboard(quiz_id)
+        cache.set(leaderboard_key(quiz_id), data, settings.QUIZ_CACHE_TIMEOUT)
+    return data
+
+
+def build_daily_challenge(date):
+    with primary():
+        return projections.daily_challenge_payload(date)
+
+
+def daily_challenge(date):
+    data = cache.get(daily_key(date))
+    if data is None:
+        data = build_daily_challenge(date)
+        cache.set(daily_key(date), data, settings.QUIZ_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_quiz(quiz_id):
+    cache.delete_many([quiz_key(quiz_id), answers_key(quiz_id)])
+
+
+def invalidate_leaderboard(quiz_id):
+    cache.delete(leaderboard_key(quiz_id))
+
+
+def invalidate_daily(date):
+    cache.delete(daily_key(date))
@@ -1,56 +1,279 @@
+import asyncio
 import json
+import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import Quiz, QuizAttempt, AttemptAnswer
+from django.conf import settings
+from . import instrumentation, matchmaking, metrics
+from .backpressure import TokenBucket, Outbox
+from .caching import correct_answer
+from .answers import record_answer
+from .models import Quiz, QuizAttempt
+from .protocol import SUBPROTOCOL, ProtocolError, build_score_event, decode_answer, encode_define_answer
+from .sharding import get_registry, worker_channel, MAX_FORWARD_HOPS
 from asgiref.sync import sync_to_async
 
+logger = logging.getLogger(__name__)
+
+
+def _save_answer(data, submitted):
+    with instrumentation.sync_call(submitted):
+        return _apply_answer(data)
+
+
+def _apply_answer(data):
+    from django.contrib.auth import get_user_model
+    user = get_user_model().objects.get(pk=data['user_id'])
+    attempt = QuizAttempt.objects.filter(user=user, quiz_id=data['quiz_id']).last()
+    is_correct = data['answer'].strip().lower() == correct_answer(data['quiz_id'], int(data['question_id']))
+    record_answer(attempt, int(data['question_id']), data['answer'], is_correct)
+    return is_correct
+
+
+async def save_answer(data):
+    with instrumentation.sync_submitted():
+        return await sync_to_async(_save_answer)(data, time.perf_counter())
+
+
+async def handle_answer(channel_layer, lobby_id, data, hops=0, is_correct=None, registry=None):
+    """Save an answer on the worker that received it, then score it on the lobby's owner worker.
+
+    Only the in-memory score update is forwarded, so an answer is in the database even if
+    the owner is slow to pick up its channel.
+    """
+    if is_correct is None:
+        is_correct = await save_answer(data)
+    registry = registry or get_registry()
+    owner = registry.owner(lobby_id)
+    if owner != registry.worker and hops < MAX_FORWARD_HOPS:
+        await channel_layer.send(worker_channel(owner), {
+            'type': 'lobby.answer',
+            'lobby_id': str(lobby_id),
+            'data': data,
+            'is_correct': is_correct,
+            'hops': hops + 1,
+        })
+        return
+
+    state = registry.state(lobby_id)
+    score = state.record_answer(data['user_id'], is_correct)
+    # Broadcast updated score or feedback, encoded once for every recipient
+    await channel_layer.group_send(
+        f'lobby_{lobby_id}',
+        instrumentation.stamp(build_score_event(data['user_id'], data['question_id'], data['answer'], score,
+                                                state.answer_id(data['answer'])))
+    )
+
+
 class LobbyConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.lobby_id = self.scope['url_route']['kwargs']['lobby_id']
         self.group_name = f'lobby_{self.lobby_id}'
+        ensure_lobby_worker(self.channel_layer)
+        instrumentation.ensure_loop_monitor()
+
+        # inbound rate limit and bounded outbound queue, see quiz/backpressure.py
+        self.limiter = TokenBucket(settings.LOBBY_RATE_LIMIT, settings.LOBBY_RATE_BURST)
+        self.outbox = Outbox(settings.LOBBY_OUTBOX_SIZE, self.lobby_id)
+        self.sender = asyncio.get_running_loop().create_task(self.drain_outbox())
+
+        # compact binary frames when the client offers the packed subprotocol (see quiz/protocol.py)
+        self.packed = SUBPROTOCOL in self.scope.get('subprotocols', [])
+        self.known_answers = {}
 
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        await self.accept(subprotocol=SUBPROTOCOL if self.packed else None)
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        sender = getattr(self, 'sender', None)
+        if sender is not None:
+            sender.cancel()
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        # Example message structure: {'type': 'answer', 'user_id': 1, 'question_id': 2, 'answer': 'A'}
-        await self.handle_message(data)
+    async def receive(self, text_data=None, bytes_data=None):
+        with instrumentation.timed('receive', lobby_id=self.lobby_id) as info:
+            data = await self.parse_frame(text_data, bytes_data)
+            if data is not None:
+                info['type'] = data.get('type')
+                # Example message structure: {'type': 'answer', 'user_id': 1, 'question_id': 2, 'answer': 'A'}
+                await self.handle_message(data)
+
+    async def parse_frame(self, text_data, bytes_data):
+        """Apply size and rate limits and decode one frame; None if it was dropped."""
+        size = len(text_data) if text_data is not None else len(bytes_data or b'')
+        if size > settings.LOBBY_MAX_MESSAGE_BYTES:
+            metrics.incr_lobby(self.lobby_id, 'oversized')
+            await self.close(code=1009)
+            return None
+        if not self.limiter.allow():
+            metrics.incr_lobby(self.lobby_id, 'rate_limited')
+            return None
+        try:
+            if bytes_data is not None and self.packed:
+                data = decode_answer(bytes_data)
+            else:
+                data = json.loads(text_data)
+        except (TypeError, ValueError, ProtocolError):
+            data = None
+        if not isinstance(data, dict):
+            metrics.incr_lobby(self.lobby_id, 'invalid')
+            return None
+        return data
 
     async def handle_message(self, data):
-        msg_type = data.get('type')
-        if msg_type == 'answer':
-            await self.save_answer(data)
-            # Broadcast updated score or feedback
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    'type': 'score_update',
-                    'user_id': data['user_id'],
-                    'question_id': data['question_id'],
-                    'answer': data['answer']
-                }
-            )
-
-    @sync_to_async
-    def save_answer(self, data):
-        from django.contrib.auth import get_user_model
-        user = get_user_model().objects.get(pk=data['user_id'])
-        attempt = QuizAttempt.objects.filter(user=user, quiz_id=data['quiz_id']).last()
-        question = Quiz.objects.get(pk=data['quiz_id']).questions.get(pk=data['question_id'])
-        is_correct = data['answer'].strip().lower() == question.correct_answer.strip().lower()
-        AttemptAnswer.objects.create(
-            attempt=attempt,
-            question=question,
-            selected_answer=data['answer'],
-            is_correct=is_correct
-        )
-        if is_correct:
-            attempt.score += 1
-            attempt.save()
+        with instrumentation.timed('handle_message'):
+            msg_type = data.get('type')
+            if msg_type == 'answer':
+                await handle_answer(self.channel_layer, self.lobby_id, data)
+
+    async def save_answer(self, data):
+        return await save_answer(data)
 
     async def score_update(self, event):
-        await self.send(text_data=json.dumps(event))
+        # queued rather than sent inline, so a slow client never blocks this consumer
+        self.outbox.push(event)
+
+    async def drain_outbox(self):
+        while True:
+            event = await self.outbox.pop()
+            packed = event.get('packed') if self.packed else None
+            if packed is not None:
+                answer_id = event['answer_id']
+                if self.known_answers.get(answer_id) != event['answer']:
+                    await self.send(bytes_data=encode_define_answer(answer_id, event['answer']))
+                    self.known_answers[answer_id] = event['answer']
+                await self.send(bytes_data=packed)
+            else:
+                await self.send(text_data=event.get('text') or json.dumps(event))
+            instrumentation.delivered(event)
+
+
+class MatchmakingConsumer(AsyncWebsocketConsumer):
+    """Queue for a public lobby: send {"type": "join", "quiz_id": 1, "size": 4}, receive a match_found event.
+
+    The client then connects to ws/lobby/<lobby_id>/ as usual.
+    """
+
+    async def connect(self):
+        ensure_lobby_worker(self.channel_layer)
+        matchmaking.ensure_running(self.channel_layer)
+        user = self.scope.get('user')
+        self.user_id = user.pk if user is not None and user.is_authenticated else None
+        self.bucket = None
+        self.limiter = TokenBucket(settings.LOBBY_RATE_LIMIT, settings.LOBBY_RATE_BURST)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.leave()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if len(text_data or bytes_data or '') > settings.LOBBY_MAX_MESSAGE_BYTES:
+            await self.close(code=1009)
+            return
+        if not self.limiter.allow():
+            return
+        try:
+            data = json.loads(text_data or bytes_data)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            await self.send_error('invalid message')
+            return
+        if data.get('type') == 'join':
+            await self.join(data)
+        elif data.get('type') == 'leave':
+            await self.leave()
+            await self.send(text_data=json.dumps({'type': 'left'}))
+
+    async def join(self, data):
+        try:
+            quiz_id, size = int(data['quiz_id']), int(data['size'])
+        except (KeyError, TypeError, ValueError):
+            await self.send_error('quiz_id and size are required')
+            return
+        if size not in settings.MATCHMAKING_LOBBY_SIZES:
+            await self.send_error(f'size must be one of {list(settings.MATCHMAKING_LOBBY_SIZES)}')
+            return
+        if not await Quiz.objects.filter(pk=quiz_id, is_public=True).aexists():
+            await self.send_error('no such public quiz')
+            return
+        await self.leave()
+        self.bucket = (quiz_id, size)
+        await matchmaking.join(self.channel_layer, {
+            'channel': self.channel_name, 'quiz_id': quiz_id, 'size': size,
+            'user_id': self.user_id, 'joined_at': time.time(),
+        })
+        await self.send(text_data=json.dumps({'type': 'queued', 'quiz_id': quiz_id, 'size': size}))
+
+    async def leave(self):
+        if self.bucket is not None:
+            await matchmaking.leave(self.channel_layer, self.channel_name, self.bucket)
+            self.bucket = None
+
+    async def send_error(self, detail):
+        await self.send(text_data=json.dumps({'type': 'error', 'detail': detail}))
+
+    async def match_found(self, event):
+        self.bucket = None
+        await self.send(text_data=json.dumps(dict(event, type='match_found')))
+
+
+class LobbyWorker:
+    """Listens on this process's `lobby-worker.<name>` channel: forwarded answers, handoffs and membership changes."""
+
+    def __init__(self, channel_layer, registry=None):
+        self.channel_layer = channel_layer
+        self.registry = registry or get_registry()
+        self.channel = worker_channel(self.registry.worker)
+
+    async def run(self):
+        while True:
+            message = await self.channel_layer.receive(self.channel)
+            handler = getattr(self, message['type'].replace('.', '_'), None)
+            if handler is None:
+                continue
+            try:
+                await handler(message)
+            except Exception:
+                logger.exception('lobby worker failed to handle %s', message['type'])
+
+    async def lobby_answer(self, message):
+        # messages from before answers were saved on the receiving worker have no is_correct
+        await handle_answer(self.channel_layer, message['lobby_id'], message['data'], message.get('hops', 0),
+                            message.get('is_correct'), self.registry)
+
+    async def lobby_handoff(self, message):
+        self.registry.adopt(message['lobbies'])
+
+    async def lobby_membership(self, message):
+        """Switch to a new worker set and hand off lobbies this worker no longer owns.
+
+        Sent to every worker when one joins or leaves (see the lobby_membership command);
+        a leaving worker receives the list without itself and hands off everything.
+        """
+        moved = self.registry.rebalance(message['workers'])
+        for owner, lobbies in moved.items():
+            if owner is not None:
+                await self.channel_layer.send(worker_channel(owner), {'type': 'lobby.handoff', 'lobbies': lobbies})
+        # matchmaking buckets live on the same ring
+        await matchmaking.hand_off(self.channel_layer)
+
+    async def matchmaking_join(self, message):
+        await matchmaking.join(self.channel_layer, message)
+
+    async def matchmaking_leave(self, message):
+        matchmaking.get_matchmaker().leave(message['channel'])
+
+
+_worker_task = None
+
+
+def ensure_lobby_worker(channel_layer):
+    """Start this process's LobbyWorker listener, or restart it if it died.
 
+    Started with the process by quiz/lifespan.py; consumers call it as well.
+    """
+    global _worker_task
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.get_running_loop().create_task(LobbyWorker(channel_layer).run())
+    return _worker_task
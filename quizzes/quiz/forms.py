@@ -6,7 +6,8 @@ from django.forms import BaseModelFormSet
 class QuizForm(forms.ModelForm):
     class Meta:
         model = Quiz
-        fields = ['title', 'is_public', 'is_timed', 'time_limit_seconds']
+        fields = ['title', 'is_public', 'is_timed', 'time_limit_seconds', 'pool_size']
+        labels = {'pool_size': 'Questions per play (leave empty to play them all)'}
 
 class QuestionForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,184 @@
+import asyncio
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from django.conf import settings
+from . import metrics
+
+# Instrumentation for the Channels side, switchable at runtime through MetricsView:
+#   event_loop_lag_seconds        how late a periodic timer fires (loop blocked by CPU or sync code)
+#   sync_queue_wait_seconds       time a sync_to_async call waits for its thread before running
+#   sync_inflight                 sync_to_async calls submitted but not finished (gauge)
+#   ws_message_seconds            handling time per inbound frame, by stage (receive/handle_message)
+#   ws_delivery_seconds           group_send on the owner -> frame handed to the client's socket
+# With profiling on, a sampling thread records the loop thread's stacks and the
+# slowest messages keep the stacks seen while they were being handled.
+
+state = {
+    'enabled': False,
+    'profile': False,
+}
+
+
+def configure():
+    state['enabled'] = settings.CHANNELS_INSTRUMENTATION
+    state['profile'] = settings.CHANNELS_PROFILING
+
+
+def enabled():
+    return state['enabled']
+
+
+def set_enabled(enabled=None, profile=None):
+    """Switch instrumentation in this process; other workers keep their own state."""
+    if enabled is not None:
+        state['enabled'] = bool(enabled)
+    if profile is not None:
+        state['profile'] = bool(profile) and state['enabled']
+    if not state['profile']:
+        profiler.stop()
+    return dict(state)
+
+
+# -- event loop lag ---------------------------------------------------------
+
+_lag_tasks = {}
+
+
+async def _watch_loop_lag(interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        if state['enabled']:
+            lag = max(loop.time() - expected, 0.0)
+            metrics.observe('event_loop_lag_seconds', lag)
+            metrics.set_gauge('event_loop_lag_last_seconds', round(lag, 6))
+
+
+def ensure_loop_monitor():
+    """Start the lag monitor for the running loop (once per loop)."""
+    loop = asyncio.get_running_loop()
+    task = _lag_tasks.get(loop)
+    if task is None or task.done():
+        _lag_tasks[loop] = loop.create_task(_watch_loop_lag(settings.CHANNELS_LOOP_LAG_INTERVAL))
+
+
+# -- sync_to_async thread pool ---------------------------------------------
+
+_inflight = [0]
+
+
+@contextmanager
+def sync_call(submitted):
+    """Wrap the body of a sync_to_async function; `submitted` is perf_counter() taken on the loop side."""
+    if state['enabled']:
+        metrics.observe('sync_queue_wait_seconds', time.perf_counter() - submitted)
+    yield
+
+
+@contextmanager
+def sync_submitted():
+    _inflight[0] += 1
+    metrics.set_gauge('sync_inflight', _inflight[0])
+    try:
+        yield
+    finally:
+        _inflight[0] -= 1
+        metrics.set_gauge('sync_inflight', _inflight[0])
+
+
+# -- per-message timing -----------------------------------------------------
+
+@contextmanager
+def timed(stage, **info):
+    """Time one stage of message handling; the caller may add details (e.g. message type) to the yielded dict."""
+    if not state['enabled']:
+        yield info
+        return
+    if state['profile']:
+        # sample the thread running the event loop, i.e. this one
+        profiler.start(threading.get_ident())
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe('ws_message_seconds', elapsed, stage=stage)
+        if state['profile'] and stage == 'receive':
+            profiler.record(start, elapsed, info)
+
+
+def stamp(event):
+    """Mark a group_send event so the receiving consumer can measure delivery latency."""
+    if state['enabled']:
+        event['sent_at'] = time.time()
+    return event
+
+
+def delivered(event):
+    sent_at = event.get('sent_at')
+    if state['enabled'] and sent_at is not None:
+        metrics.observe('ws_delivery_seconds', max(time.time() - sent_at, 0.0))
+
+
+# -- sampling profiler ------------------------------------------------------
+
+class SlowMessageProfiler:
+    def __init__(self, interval=0.002, keep=20, depth=40):
+        self.interval = interval
+        self.keep = keep
+        self.depth = depth
+        self.samples = deque(maxlen=50000)
+        self.slowest = []
+        self._ids = itertools.count()
+        self._thread = None
+        self._target = None
+        self._stop = threading.Event()
+
+    def start(self, thread_id):
+        self._target = thread_id
+        self._stop.clear()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='slow-message-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), ';'.join(reversed(stack))))
+
+    def record(self, start, elapsed, info):
+        if len(self.slowest) >= self.keep and elapsed <= self.slowest[0][0]:
+            return
+        end = start + elapsed
+        stacks = Counter(stack for ts, stack in list(self.samples) if start <= ts <= end)
+        entry = (elapsed, next(self._ids), dict(info, seconds=round(elapsed, 6), stacks=dict(stacks.most_common(20))))
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heapreplace(self.slowest, entry)
+
+    def dump(self):
+        return [entry[2] for entry in sorted(self.slowest, reverse=True)]
+
+    def clear(self):
+        self.slowest.clear()
+        self.samples.clear()
+
+
+profiler = SlowMessageProfiler()
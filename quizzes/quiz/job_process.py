@@ -0,0 +1,12 @@
+# Entry points for `run_jobs --processes`. Spawned pool processes import this
+# module before Django is set up, so it must not import models at module level.
+
+
+def setup():
+    import django
+    django.setup()
+
+
+def execute(job_id):
+    from .jobs import execute
+    return execute(job_id)
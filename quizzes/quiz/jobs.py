@@ -0,0 +1,184 @@
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+from .models import Job, JobSchedule
+
+# Database-backed job queue, no broker needed.
+# Functions registered with @job (see quiz/tasks.py) are queued with enqueue()
+# and run by `manage.py run_jobs`, which claims due jobs with a conditional
+# UPDATE (so any number of workers can share the table), runs them in a thread
+# or process pool, retries failures with exponential backoff and queues the
+# periodic jobs listed in settings.JOB_SCHEDULES. Running jobs get a heartbeat
+# from their worker; one without a heartbeat for JOB_LEASE_SECONDS is retried.
+# Run times are kept on the Job rows, and stats() (served on /api/metrics/)
+# summarizes them across all workers.
+
+registry = {}
+
+
+def job(name=None, max_attempts=3, retry_delay=30, max_retry_delay=3600):
+    """Register a function as a job; it is still callable directly. Its kwargs must be JSON serializable."""
+    def register(func):
+        func.job_name = name or func.__name__
+        func.max_attempts = max_attempts
+        func.retry_delay = retry_delay
+        func.max_retry_delay = max_retry_delay
+        registry[func.job_name] = func
+        return func
+    return register
+
+
+def enqueue(name, kwargs=None, dedupe_key=None, delay=0, run_at=None):
+    """Queue a job (by name or registered function) and return it.
+
+    With a dedupe_key, a job that is already queued under the same key is returned instead of adding another.
+    """
+    name = getattr(name, 'job_name', name)
+    func = registry.get(name)
+    if func is None:
+        raise LookupError(f"no job registered as {name!r}")
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(name=name, kwargs=kwargs or {}, dedupe_key=dedupe_key,
+                                      run_at=run_at, max_attempts=func.max_attempts)
+    except IntegrityError:
+        if dedupe_key is None:
+            raise
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status=Job.QUEUED).first()
+        if existing is None:
+            # claimed between our insert and this read; the change still needs a run
+            return enqueue(name, kwargs, dedupe_key, delay, run_at)
+        return existing
+
+
+def worker_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def claim(worker, limit):
+    """Mark up to `limit` due jobs as running for this worker and return their ids."""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        .order_by('run_at', 'id').values_list('id', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for job_id in candidates:
+        # another worker may have taken it since the SELECT; the status check makes the claim exclusive
+        if Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+                status=Job.RUNNING, locked_by=worker, started_at=now, heartbeat_at=now,
+                attempts=F('attempts') + 1):
+            claimed.append(job_id)
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def backoff(func, attempts):
+    """Seconds before retry number `attempts`: exponential, capped, with jitter so retries don't bunch up."""
+    base = getattr(func, 'retry_delay', 30)
+    cap = getattr(func, 'max_retry_delay', 3600)
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+def _failed(job, error, elapsed):
+    """Queue a retry if the job has attempts left, otherwise mark it failed. Returns the outcome."""
+    now = timezone.now()
+    func = registry.get(job.name)
+    done = dict(last_error=error[-5000:], finished_at=now, duration_seconds=elapsed)
+    if func is not None and job.attempts < job.max_attempts:
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk).update(
+                    status=Job.QUEUED, run_at=now + timedelta(seconds=backoff(func, job.attempts)), **done)
+            return 'retry'
+        except IntegrityError:
+            # a newer job with the same dedupe key is queued and will do the same work
+            pass
+    Job.objects.filter(pk=job.pk).update(status=Job.FAILED, **done)
+    return 'failed'
+
+
+def execute(job_id):
+    """Run one claimed job and record the result. Returns (name, outcome, seconds)."""
+    close_old_connections()
+    try:
+        job = Job.objects.get(pk=job_id)
+        func = registry.get(job.name)
+        start = time.perf_counter()
+        try:
+            if func is None:
+                raise LookupError(f"no job registered as {job.name!r}")
+            func(**job.kwargs)
+        except Exception:
+            elapsed = time.perf_counter() - start
+            outcome = _failed(job, traceback.format_exc(), elapsed)
+        else:
+            elapsed = time.perf_counter() - start
+            Job.objects.filter(pk=job_id).update(
+                status=Job.DONE, last_error='', finished_at=timezone.now(), duration_seconds=elapsed)
+            outcome = 'done'
+        return job.name, outcome, elapsed
+    finally:
+        close_old_connections()
+
+
+def heartbeat(worker, job_ids):
+    """Mark the worker's running jobs as alive, so requeue_expired() leaves them be however long they take."""
+    return Job.objects.filter(pk__in=job_ids, status=Job.RUNNING, locked_by=worker).update(
+        heartbeat_at=timezone.now())
+
+
+def requeue_expired(lease=None):
+    """Treat running jobs without a heartbeat for the lease as failed (their worker died) so they are retried."""
+    lease = settings.JOB_LEASE_SECONDS if lease is None else lease
+    cutoff = timezone.now() - timedelta(seconds=lease)
+    expired = Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff), status=Job.RUNNING)
+    count = 0
+    for job in expired:
+        _failed(job, f"no heartbeat for {lease}s (worker {job.locked_by} gone?)", None)
+        count += 1
+    return count
+
+
+def queue_due_schedules(schedules=None):
+    """Queue every periodic job that is due; safe to call from several workers at once."""
+    schedules = settings.JOB_SCHEDULES if schedules is None else schedules
+    now = timezone.now()
+    queued = []
+    for name, schedule in schedules.items():
+        entry, _ = JobSchedule.objects.get_or_create(name=name, defaults={'next_run_at': now})
+        if entry.next_run_at > now:
+            continue
+        # only the worker whose UPDATE moves next_run_at on queues the job
+        if JobSchedule.objects.filter(pk=entry.pk, next_run_at=entry.next_run_at).update(
+                next_run_at=now + timedelta(seconds=schedule['every'])):
+            enqueue(schedule['job'], schedule.get('kwargs'), dedupe_key=f'schedule:{name}')
+            queued.append(name)
+    return queued
+
+
+def stats(since=None):
+    """Per job name: how many jobs are in each status, and timing of the finished ones."""
+    jobs = Job.objects.all()
+    if since is not None:
+        jobs = jobs.filter(created_at__gte=since)
+    report = {}
+    for row in jobs.values('name', 'status').annotate(n=Count('id')):
+        report.setdefault(row['name'], {})[row['status']] = row['n']
+    timings = (jobs.filter(duration_seconds__isnull=False).values('name')
+               .annotate(avg=Avg('duration_seconds'), max=Max('duration_seconds')))
+    for row in timings:
+        report[row['name']]['avg_seconds'] = round(row['avg'], 4)
+        report[row['name']]['max_seconds'] = round(row['max'], 4)
+    return report
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import sys
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+# Per-process background tasks that must run before any socket connects to the
+# process: a lobby's owner worker may have no socket of its own and still has
+# to pick up the score updates forwarded to its `lobby-worker.<name>` channel,
+# and the owner of a matchmaking bucket has to match the players forwarded to it.
+#
+# Servers that speak the ASGI lifespan protocol (uvicorn, hypercorn) start them
+# on lifespan.startup. Daphne does not send lifespan events, so asgi.py also
+# schedules them on Daphne's event loop with start_when_loop_runs().
+
+_tasks = []
+
+
+def start():
+    """Start the background tasks on the running loop (a no-op for those already running)."""
+    from . import matchmaking
+    from .consumers import ensure_lobby_worker
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    _tasks[:] = [ensure_lobby_worker(channel_layer), matchmaking.ensure_running(channel_layer)]
+
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+
+def start_when_loop_runs():
+    """Called at import of asgi.py: start now if a loop is running, else once Daphne's loop does."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        daphne_server = sys.modules.get('daphne.server')
+        if daphne_server is not None:
+            daphne_server.twisted_loop.call_soon(start)
+    else:
+        start()
+
+
+class LifespanMiddleware:
+    """Answers ASGI lifespan events (Channels' router rejects them) and starts the tasks on startup."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    start()
+                except Exception as exc:
+                    logger.exception('could not start background tasks')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
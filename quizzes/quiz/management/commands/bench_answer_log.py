@@ -0,0 +1,94 @@
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from quiz import answer_log
+from quiz.models import AnswerLogCheckpoint, AttemptAnswer, Question, Quiz, QuizAttempt
+
+
+class Command(BaseCommand):
+    help = ("Compare answer ack latency (committed ORM insert vs log append) and projection throughput; "
+            "test rows are removed. Projection consistency is covered by quiz.tests.AnswerLogTests.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--answers', type=int, default=2000)
+        parser.add_argument('--attempts', type=int, default=50)
+        parser.add_argument('--writers', type=int, default=8, help="threads appending to the log concurrently")
+        parser.add_argument('--no-fsync', action='store_true', help="measure appends without fsync")
+
+    def handle(self, *args, **options):
+        quiz = Quiz.objects.filter(questions__isnull=False).first()
+        if quiz is None:
+            raise CommandError("Need at least one quiz with questions.")
+        question_ids = list(Question.objects.filter(quiz=quiz).values_list('id', flat=True))
+        user, created = User.objects.get_or_create(username='answer-log-bench')
+        try:
+            with tempfile.TemporaryDirectory() as log_dir:
+                with override_settings(ANSWER_LOG_DIR=log_dir, ANSWER_LOG_SEGMENT_BYTES=64 * 1024,
+                                       ANSWER_LOG_FSYNC=not options['no_fsync']):
+                    self.run(user, quiz, question_ids, options)
+        finally:
+            QuizAttempt.objects.filter(user=user).delete()
+            AnswerLogCheckpoint.objects.filter(writer='bench').delete()
+            if created:
+                user.delete()
+
+    def run(self, user, quiz, question_ids, options):
+        n = options['answers']
+        attempts = [QuizAttempt.objects.create(user=user, quiz=quiz) for _ in range(options['attempts'])]
+        events = [
+            (attempts[i % len(attempts)], question_ids[i % len(question_ids)], 'x', i % 3 == 0)
+            for i in range(n)
+        ]
+
+        # ORM path: what every answer costs today, one commit per answer
+        orm = []
+        started = time.perf_counter()
+        for attempt, question_id, selected, is_correct in events[:min(n, 500)]:
+            start = time.perf_counter()
+            with transaction.atomic():
+                AttemptAnswer.objects.create(attempt=attempt, question_id=question_id,
+                                             selected_answer=selected, is_correct=is_correct)
+                if is_correct:
+                    attempt.score += 1
+                    attempt.save()
+            orm.append(time.perf_counter() - start)
+        self.report('orm insert', orm, time.perf_counter() - started)
+        AttemptAnswer.objects.filter(attempt__in=attempts).delete()
+        QuizAttempt.objects.filter(pk__in=[a.id for a in attempts]).update(score=0)
+
+        log = answer_log.AnswerLog(Path(settings.ANSWER_LOG_DIR) / 'bench', settings.ANSWER_LOG_SEGMENT_BYTES,
+                                   fsync=settings.ANSWER_LOG_FSYNC)
+
+        def append(event):
+            attempt, question_id, selected, is_correct = event
+            start = time.perf_counter()
+            log.append({'attempt_id': attempt.id, 'question_id': question_id,
+                        'selected_answer': selected, 'is_correct': is_correct, 'ts': time.time()})
+            return time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['writers']) as pool:
+            appends = list(pool.map(append, events))
+        self.report('log append', appends, time.perf_counter() - started)
+        log.file.close()
+        self.stdout.write(f"{n} events in {len(answer_log.list_segments(log.directory))} segments")
+
+        start = time.perf_counter()
+        applied = answer_log.project(batch_size=500)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"projected {applied} events in {elapsed:.2f}s ({applied / elapsed:.0f}/s)")
+
+    def report(self, label, samples, elapsed):
+        samples = sorted(samples)
+        p99 = samples[max(int(len(samples) * 0.99) - 1, 0)]
+        self.stdout.write(
+            f"{label:>11}: p50 {statistics.median(samples) * 1000:.3f}ms  p99 {p99 * 1000:.3f}ms  "
+            f"{len(samples) / elapsed:.0f}/s"
+        )
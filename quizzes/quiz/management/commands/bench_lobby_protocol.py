@@ -0,0 +1,50 @@
+import json
+import random
+import time
+from django.core.management.base import BaseCommand
+from quiz.protocol import build_score_event
+from quiz.sharding import LobbyState
+
+
+class Command(BaseCommand):
+    help = "Compare bytes and CPU per score_update broadcast for per-recipient JSON, JSON once and packed frames"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lobby-size', type=int, default=200)
+        parser.add_argument('--broadcasts', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        state = LobbyState('bench')
+        answers = [
+            (rng.randint(1, 100000), rng.randint(1, 100000), rng.choice(['A', 'B', 'C', 'D', 'True', 'False']))
+            for _ in range(options['broadcasts'])
+        ]
+        recipients = range(options['lobby_size'])
+
+        def per_recipient_json(user_id, question_id, answer, score):
+            # what score_update did before: json.dumps(event) in every consumer
+            event = {'type': 'score_update', 'user_id': user_id, 'question_id': question_id,
+                     'answer': answer, 'score': score}
+            return sum(len(json.dumps(event)) for _ in recipients)
+
+        def shared_event(key):
+            def broadcast(user_id, question_id, answer, score):
+                event = build_score_event(user_id, question_id, answer, score, state.answer_id(answer))
+                frame = event[key]
+                return sum(len(frame) for _ in recipients)
+            return broadcast
+
+        self.stdout.write(f"lobby of {options['lobby_size']}, {options['broadcasts']} broadcasts")
+        for label, fn in [('json per recipient', per_recipient_json),
+                          ('json once', shared_event('text')),
+                          ('packed once', shared_event('packed'))]:
+            total_bytes = 0
+            start = time.process_time()
+            for user_id, question_id, answer in answers:
+                total_bytes += fn(user_id, question_id, answer, rng.randint(0, 50))
+            cpu = time.process_time() - start
+            self.stdout.write(
+                f"{label:>20}: {total_bytes / len(answers):>9.0f} bytes/broadcast, "
+                f"{cpu / len(answers) * 1e6:>8.1f} us CPU/broadcast"
+            )
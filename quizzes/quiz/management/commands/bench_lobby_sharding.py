@@ -0,0 +1,145 @@
+import asyncio
+import multiprocessing as mp
+import queue
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+
+def busy_wait(microseconds):
+    end = time.perf_counter() + microseconds / 1e6
+    while time.perf_counter() < end:
+        pass
+
+
+class QueueChannelLayer:
+    """Stands in for the channel layer across worker processes: one multiprocessing queue per worker channel.
+
+    group_send only counts the answer as handled, after the simulated per-answer work.
+    """
+
+    def __init__(self, inboxes, work_us):
+        self.inboxes = inboxes
+        self.work_us = work_us
+        self.handled = 0
+
+    async def send(self, channel, message):
+        self.inboxes[channel.split('.', 1)[1]].put(message)
+
+    async def receive(self, channel):
+        inbox = self.inboxes[channel.split('.', 1)[1]]
+        while True:
+            try:
+                return inbox.get_nowait()
+            except queue.Empty:
+                await asyncio.sleep(0.001)
+
+    async def group_send(self, group, message):
+        busy_wait(self.work_us)
+        self.handled += 1
+
+
+def run_worker(name, workers, inboxes, handled, forwarded, start, stop, results, options):
+    """One worker process running the real LobbyWorker and handle_answer against QueueChannelLayer."""
+    import django
+    django.setup()
+    from quiz.consumers import LobbyWorker
+    from quiz.sharding import LobbyRegistry
+
+    registry = LobbyRegistry(name, workers)
+    layer = QueueChannelLayer(inboxes, options['work_us'])
+    worker = LobbyWorker(layer, registry)
+    counts = {'forwarded': 0}
+
+    async def lobby_answer(message):
+        if message.get('hops', 0):
+            counts['forwarded'] += 1
+        await LobbyWorker.lobby_answer(worker, message)
+    worker.lobby_answer = lobby_answer
+
+    async def main():
+        task = asyncio.get_running_loop().create_task(worker.run())
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+            # shared counters are updated in batches, a lock per message would dominate the run
+            with handled.get_lock():
+                handled.value += layer.handled
+            with forwarded.get_lock():
+                forwarded.value += counts['forwarded']
+            layer.handled = counts['forwarded'] = 0
+        task.cancel()
+
+    start.wait()
+    asyncio.run(main())
+    results.put((name, {lobby_id: state.answers for lobby_id, state in registry.lobbies.items()}))
+
+
+class Command(BaseCommand):
+    help = ("Measure lobby message throughput as the number of sharded worker processes grows, through the real "
+            "LobbyWorker forwarding path, and check every answer was scored once on its lobby's owner")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4', help="comma-separated worker counts to try")
+        parser.add_argument('--messages', type=int, default=20000)
+        parser.add_argument('--lobbies', type=int, default=500)
+        parser.add_argument('--work-us', type=int, default=50, help="simulated game logic and fan-out per answer")
+
+    def handle(self, *args, **options):
+        baseline = None
+        for count in [int(n) for n in options['workers'].split(',')]:
+            rate, forwarded = self.run(count, options)
+            baseline = baseline or rate
+            self.stdout.write(
+                f"{count:>3} workers: {rate:>9.0f} msg/s  (x{rate / baseline:.2f}), "
+                f"{forwarded / options['messages']:.0%} forwarded to owner"
+            )
+
+    def run(self, count, options):
+        from quiz.sharding import LobbyRegistry
+
+        rng = random.Random(0)
+        workers = [f'w{i}' for i in range(count)]
+        inboxes = {name: mp.Queue() for name in workers}
+        handled, forwarded = mp.Value('q', 0), mp.Value('q', 0)
+        start, stop = mp.Event(), mp.Event()
+        results = mp.Queue()
+
+        # every answer lands on a random worker, like a load balancer spreading sockets; that worker
+        # has already saved it (is_correct is set) and must get the score update to the lobby's owner
+        for i in range(options['messages']):
+            answer = rng.choice('ABCD')
+            inboxes[rng.choice(workers)].put({
+                'type': 'lobby.answer',
+                'lobby_id': str(rng.randint(1, options['lobbies'])),
+                'data': {'type': 'answer', 'user_id': rng.randint(1, 5000), 'question_id': i, 'answer': answer},
+                'is_correct': answer == 'A',
+                'hops': 0,
+            })
+
+        procs = [
+            mp.Process(target=run_worker,
+                       args=(name, workers, inboxes, handled, forwarded, start, stop, results, options))
+            for name in workers
+        ]
+        for proc in procs:
+            proc.start()
+        began = time.perf_counter()
+        start.set()
+        while handled.value < options['messages']:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - began
+        stop.set()
+        owned = dict(results.get() for _ in procs)
+        for proc in procs:
+            proc.join()
+
+        ring = LobbyRegistry(None, workers)
+        scored = 0
+        for name, lobbies in owned.items():
+            for lobby_id, answers in lobbies.items():
+                if ring.owner(lobby_id) != name:
+                    raise CommandError(f"lobby {lobby_id} was scored on {name}, not its owner {ring.owner(lobby_id)}")
+                scored += answers
+        if scored != options['messages']:
+            raise CommandError(f"{scored} answers scored for {options['messages']} sent")
+        return options['messages'] / elapsed, forwarded.value
@@ -0,0 +1,90 @@
+import random
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from quiz import matchmaking
+from quiz.models import Quiz
+
+
+class Command(BaseCommand):
+    help = ("Per-player cost of joining and matching as the queue grows, then a simulation that matches a full "
+            "queue into Lobby/GameSession rows and notifies every player (seeded rows are rolled back)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=10000)
+        parser.add_argument('--quizzes', type=int, default=50)
+        parser.add_argument('--target-ms', type=float, default=1000.0,
+                            help="time allowed to match and notify the whole queue")
+
+    def handle(self, *args, **options):
+        sizes = settings.MATCHMAKING_LOBBY_SIZES
+        rng = random.Random(0)
+
+        self.stdout.write("in-memory queue, per player:")
+        for n in (1000, 10000, 100000):
+            matchmaker = self.matchmaker()
+            tickets = [(f'c{i}', rng.randrange(options['quizzes']), rng.choice(sizes)) for i in range(n)]
+            start = time.perf_counter()
+            for channel, quiz_id, size in tickets:
+                matchmaker.join(channel, quiz_id, size)
+            joined = time.perf_counter()
+            matched = sum(len(m.tickets) for m in matchmaker.due())
+            done = time.perf_counter()
+            self.stdout.write(
+                f"  {n:>7} queued: join {(joined - start) / n * 1e6:.2f}us  "
+                f"match {(done - joined) / max(matched, 1) * 1e6:.2f}us  ({matched} matched)"
+            )
+
+        with transaction.atomic():
+            self.simulate(rng, sizes, options)
+            transaction.set_rollback(True)
+
+    def matchmaker(self):
+        return matchmaking.Matchmaker(settings.MATCHMAKING_LOBBY_SIZES, settings.MATCHMAKING_MIN_PLAYERS,
+                                      settings.MATCHMAKING_MAX_WAIT, settings.MATCHMAKING_FILL_SECONDS)
+
+    def simulate(self, rng, sizes, options):
+        user_model = get_user_model()
+        host, _ = user_model.objects.get_or_create(username="guest")
+        quizzes = Quiz.objects.bulk_create(
+            [Quiz(title=f"Matchmaking quiz {i}", creator=host) for i in range(options['quizzes'])]
+        )
+        quiz_ids = [quiz.pk for quiz in quizzes]
+        layer = InMemoryChannelLayer(capacity=10)
+        channels = [async_to_sync(layer.new_channel)() for _ in range(options['players'])]
+
+        matchmaker = self.matchmaker()
+        for channel in channels:
+            matchmaker.join(channel, rng.choice(quiz_ids), rng.choice(sizes), host.pk)
+        self.stdout.write(f"simulation: {len(matchmaker)} players queued for {len(matchmaker.queues)} buckets")
+
+        # one matching pass: take the groups, create their rows, notify every player
+        start = time.perf_counter()
+        matches = matchmaking.form_matches(matchmaker)
+        formed = time.perf_counter()
+        async_to_sync(matchmaking.notify)(layer, matches)
+        elapsed = time.perf_counter() - start
+        players = sum(len(m.tickets) for m in matches)
+        verdict = self.style.SUCCESS("within") if elapsed * 1000 <= options['target_ms'] else self.style.ERROR("over")
+        self.stdout.write(
+            f"  full lobbies: {players} players into {len(matches)} lobbies in {elapsed * 1000:.0f}ms "
+            f"(rows {(formed - start) * 1000:.0f}ms, notify {(time.perf_counter() - formed) * 1000:.0f}ms), "
+            f"{verdict} the {options['target_ms']:.0f}ms target"
+        )
+
+        # the rest wait for MATCHMAKING_MAX_WAIT and start short-handed
+        waiting = len(matchmaker)
+        start = time.perf_counter()
+        matches = matchmaking.form_matches(matchmaker, time.time() + settings.MATCHMAKING_MAX_WAIT)
+        async_to_sync(matchmaking.notify)(layer, matches)
+        self.stdout.write(
+            f"  after max wait: {waiting - len(matchmaker)} of {waiting} leftover players into {len(matches)} "
+            f"lobbies in {(time.perf_counter() - start) * 1000:.0f}ms, {len(matchmaker)} still waiting"
+        )
+
+        received = sum(1 for channel in channels if layer.channels.get(channel))
+        self.stdout.write(f"  {received} of {len(channels)} players have a match_found event")
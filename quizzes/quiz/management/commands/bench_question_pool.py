@@ -0,0 +1,67 @@
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from quiz import pools
+from quiz.models import Question, Quiz, QuizAttempt
+
+
+class Command(BaseCommand):
+    help = ("Latency of drawing an attempt's questions and of quiz_game page views as the question pool grows, "
+            "pool mode against playing every question (seeded rows are rolled back)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,10000,100000', help="comma-separated pool sizes")
+        parser.add_argument('--pool-size', type=int, default=20, help="questions per play")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        user_model = get_user_model()
+        creator, _ = user_model.objects.get_or_create(username="guest")
+        self.stdout.write(f"{'questions':>10} {'mode':>6} {'draw':>9} {'GET':>9} {'POST':>9}   (median ms)")
+        for count in (int(n) for n in options['sizes'].split(',')):
+            quiz = Quiz.objects.create(title=f"Pool of {count}", creator=creator, is_public=True)
+            Question.objects.bulk_create([
+                Question(quiz=quiz, text=f"Question {i}", question_type='MC', correct_answer='a')
+                for i in range(count)
+            ], batch_size=5000)
+            for mode, pool_size in (('pool', options['pool_size']), ('full', None)):
+                quiz.pool_size = pool_size
+                quiz.save(update_fields=['pool_size'])
+                draw = self.time_draw(quiz, options['repeat']) if pool_size else None
+                get, post = self.time_views(quiz, options['repeat'])
+                draw = f"{draw:9.2f}" if draw is not None else f"{'-':>9}"
+                self.stdout.write(f"{count:>10} {mode:>6} {draw} {get:9.2f} {post:9.2f}")
+
+    def time_draw(self, quiz, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ids = pools.draw(quiz.id, quiz.pool_size, pools.new_seed())
+            timings.append(time.perf_counter() - start)
+            assert len(set(ids)) == quiz.pool_size
+        return statistics.median(timings) * 1000
+
+    def time_views(self, quiz, repeat):
+        client = Client(HTTP_HOST='localhost')
+        url = reverse('quiz-game', args=[quiz.id])
+        client.post(url, {'retake': '1'})
+        attempt = QuizAttempt.objects.get(pk=client.session[f'quiz_{quiz.id}_attempt_id'])
+        question_ids = pools.question_ids(attempt)
+        gets, posts = [], []
+        for question_id in question_ids[:repeat]:
+            start = time.perf_counter()
+            client.get(url)
+            gets.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            client.post(url, {'question_id': question_id, 'answer': 'a'})
+            posts.append(time.perf_counter() - start)
+        return statistics.median(gets) * 1000, statistics.median(posts) * 1000
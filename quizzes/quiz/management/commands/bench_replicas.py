@@ -0,0 +1,69 @@
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from quiz.models import Quiz
+
+
+class Command(BaseCommand):
+    help = "Replay a read-heavy request mix and count queries per database, with and without replicas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--play-ratio', type=float, default=0.2,
+                            help="share of requests that play a quiz (always on the primary)")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("Set DATABASE_REPLICAS and run sync_replicas first.")
+        quiz_ids = list(Quiz.objects.filter(is_public=True).values_list('id', flat=True))
+        if not quiz_ids:
+            raise CommandError("Need at least one public quiz.")
+
+        for label, replicas in [('primary only', []), ('with replicas', settings.DATABASE_REPLICAS)]:
+            with override_settings(DATABASE_REPLICAS=replicas):
+                counts, elapsed = self.replay(quiz_ids, options)
+            total = sum(counts.values())
+            primary = counts.get('default', 0)
+            self.stdout.write(
+                f"{label:>14}: {primary} of {total} queries on primary ({primary / total:.0%}), "
+                f"{options['requests'] / elapsed:.0f} req/s  {dict(counts)}"
+            )
+
+    def replay(self, quiz_ids, options):
+        rng = random.Random(0)
+        counts = Counter()
+
+        def counter(alias):
+            def wrapper(execute, sql, params, many, context):
+                counts[alias] += 1
+                return execute(sql, params, many, context)
+            return wrapper
+
+        client = Client(HTTP_HOST='localhost')
+        reads = [
+            lambda: reverse('public-quizzes'),
+            lambda: reverse('quiz-detail', args=[rng.choice(quiz_ids)]),
+            lambda: reverse('leaderboard', args=[rng.choice(quiz_ids)]),
+            lambda: reverse('daily-challenge'),
+            lambda: reverse('quizzes'),
+        ]
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter(alias)))
+            # answers written by the play requests are rolled back afterwards
+            with transaction.atomic():
+                start = time.perf_counter()
+                for _ in range(options['requests']):
+                    if rng.random() < options['play_ratio']:
+                        client.get(reverse('quiz-game', args=[rng.choice(quiz_ids)]))
+                    else:
+                        client.get(rng.choice(reads)())
+                elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+        return counts, elapsed
@@ -0,0 +1,80 @@
+import itertools
+import random
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from quiz import search
+from quiz.models import Quiz, Question
+
+SYLLABLES = "ka lo mi ne ru sa te vo zi pa do ge hu ja ki".split()
+
+
+def make_vocabulary(rng, size):
+    # made-up words, so the benchmark does not depend on any real question bank
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+class Command(BaseCommand):
+    help = ("Compare FTS5 search latency with the icontains scan for rare words, common words and short "
+            "prefixes (seeded data is rolled back)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=1000000,
+                            help="number of synthetic questions to seed (0 to use existing data)")
+        parser.add_argument('--queries', type=int, default=20, help="queries per kind")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--vocabulary', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        words = make_vocabulary(rng, options['vocabulary'])
+        # word frequencies follow Zipf's law, as in real text: the first words are in a large share of rows
+        weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+        n = options['queries']
+        queries = {
+            'rare word': [rng.choice(words[len(words) // 2:]) for _ in range(n)],
+            'common word': [rng.choice(words[:20]) for _ in range(n)],
+            'two words': [f'{rng.choice(words[:200])} {rng.choice(words[:200])}' for _ in range(n)],
+            '1-char': [rng.choice(SYLLABLES)[0] for _ in range(n)],
+            '2-char prefix': [rng.choice(SYLLABLES) for _ in range(n)],
+            '3-char prefix': [rng.choice(words[:200])[:3] for _ in range(n)],
+        }
+        with transaction.atomic():
+            if options['questions']:
+                self.seed(rng, words, weights, options['questions'], options['batch_size'])
+            for kind, texts in queries.items():
+                self.report(f"fts5 {kind}", search.search, texts)
+            self.report("icontains rare word", search.search_icontains, queries['rare word'])
+            self.report("icontains common word", search.search_icontains, queries['common word'])
+            transaction.set_rollback(True)
+
+    def seed(self, rng, words, weights, count, batch_size):
+        creator, _ = get_user_model().objects.get_or_create(username="guest")
+        quiz = Quiz.objects.create(title="Benchmark quiz", creator=creator, is_public=True)
+        start = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            Question.objects.bulk_create([
+                Question(quiz=quiz, question_type='TF', correct_answer='True',
+                         text=' '.join(rng.choices(words, cum_weights=weights, k=12)))
+                for _ in range(min(batch_size, count - offset))
+            ])
+        self.stdout.write(f"seeded {count} questions in {time.perf_counter() - start:.1f}s")
+
+    def report(self, label, fn, queries):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            fn(query, 1, search.DEFAULT_PAGE_SIZE)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        self.stdout.write(
+            f"{label:>22}: median {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms over {len(timings)} queries"
+        )
@@ -0,0 +1,84 @@
+import time
+import tracemalloc
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from quiz import projections
+from quiz.models import Quiz, Question, LeaderboardEntry
+from quiz.renderers import FastJSONRenderer, iter_json_list
+from quiz.serializers import QuizSerializer, LeaderboardEntrySerializer
+
+
+class Command(BaseCommand):
+    help = ("Rows/s and peak memory of ModelSerializer + JSONRenderer vs .values() projections + FastJSONRenderer "
+            "(and streaming) for a big leaderboard and quiz catalogue (seeded data is rolled back)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=50000, help="leaderboard rows")
+        parser.add_argument('--quizzes', type=int, default=500, help="catalogue quizzes")
+        parser.add_argument('--questions', type=int, default=10, help="questions per quiz")
+        parser.add_argument('--repeat', type=int, default=3, help="timed runs per path (best is reported)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            quiz, quiz_ids = self.seed(options)
+            entries = options['entries']
+            leaderboard = LeaderboardEntry.objects.filter(quiz=quiz).order_by(*projections.LEADERBOARD_ORDER)
+            self.stdout.write(f"leaderboard, {entries} rows")
+            self.compare(entries, options['repeat'], [
+                ('serializer', lambda: JSONRenderer().render(LeaderboardEntrySerializer(leaderboard, many=True).data)),
+                ('projection', lambda: FastJSONRenderer().render(list(projections.leaderboard_rows(quiz.id)))),
+                ('streamed', lambda: self.drain(projections.leaderboard_rows(quiz.id, chunk_size=2000))),
+            ])
+
+            catalogue = Quiz.objects.filter(pk__in=quiz_ids).prefetch_related('questions')
+            self.stdout.write(f"catalogue, {len(quiz_ids)} quizzes x {options['questions']} questions")
+            self.compare(len(quiz_ids), options['repeat'], [
+                ('serializer', lambda: JSONRenderer().render(QuizSerializer(catalogue, many=True).data)),
+                ('projection', lambda: FastJSONRenderer().render(list(projections.quiz_payloads(quiz_ids).values()))),
+            ])
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        user, _ = get_user_model().objects.get_or_create(username="guest")
+        quiz = Quiz.objects.create(title="Benchmark leaderboard", creator=user)
+        LeaderboardEntry.objects.bulk_create(
+            [LeaderboardEntry(quiz=quiz, user=user, score=i % 97, time_taken_seconds=i % 600)
+             for i in range(options['entries'])],
+            batch_size=5000,
+        )
+        quizzes = Quiz.objects.bulk_create(
+            [Quiz(title=f"Benchmark quiz {i}", creator=user) for i in range(options['quizzes'])]
+        )
+        Question.objects.bulk_create(
+            [Question(quiz=q, text=f"Question {n} of quiz {q.id}?", question_type='MC', correct_answer='a',
+                      option_a='a', option_b='b', option_c='c', option_d='d')
+             for q in quizzes for n in range(options['questions'])],
+            batch_size=5000,
+        )
+        return quiz, [q.id for q in quizzes]
+
+    def drain(self, rows):
+        # what a streamed response does: encode and hand off chunk by chunk, keeping none of them
+        return sum(len(chunk) for chunk in iter_json_list(rows))
+
+    def compare(self, rows, repeat, paths):
+        baseline = None
+        for label, fn in paths:
+            best = min(self.timed(fn) for _ in range(repeat))
+            # memory is measured on a separate run, tracemalloc slows everything down
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            baseline = baseline or best
+            self.stdout.write(
+                f"  {label:>10}: {rows / best:>10.0f} rows/s  {best * 1000:8.1f} ms  "
+                f"peak {peak / 2 ** 20:6.1f} MiB  x{baseline / best:.1f}"
+            )
+
+    def timed(self, fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
@@ -0,0 +1,22 @@
+import json
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from quiz import jobs
+from quiz.models import Job
+
+
+class Command(BaseCommand):
+    help = "Job counts by status and run times per job name, plus the most recent failures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help="look at jobs created in this window")
+        parser.add_argument('--failures', type=int, default=5)
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours'])
+        self.stdout.write(json.dumps(jobs.stats(since), indent=2))
+        failed = Job.objects.filter(status=Job.FAILED, created_at__gte=since).order_by('-finished_at')
+        for job in failed[:options['failures']]:
+            last_line = job.last_error.strip().splitlines()[-1:] or ['']
+            self.stdout.write(self.style.ERROR(f"{job} after {job.attempts} attempts: {last_line[0]}"))
@@ -0,0 +1,26 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from quiz.sharding import worker_channel
+
+
+class Command(BaseCommand):
+    help = "Announce a new lobby worker set; workers that lose lobbies hand their state to the new owners"
+
+    def add_arguments(self, parser):
+        parser.add_argument('workers', nargs='+', help="the complete new list of worker names")
+        parser.add_argument('--previous', nargs='*', default=None,
+                            help="current workers (defaults to settings.LOBBY_WORKERS)")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        previous = options['previous'] if options['previous'] is not None else settings.LOBBY_WORKERS
+        channel_layer = get_channel_layer()
+        # leaving workers must hear about it too, so they can hand off everything they own
+        for worker in sorted(set(previous) | set(workers)):
+            async_to_sync(channel_layer.send)(worker_channel(worker), {
+                'type': 'lobby.membership',
+                'workers': workers,
+            })
+        self.stdout.write(self.style.SUCCESS(f"Lobby workers: {', '.join(workers)}"))
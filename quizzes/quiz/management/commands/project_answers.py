@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from quiz.answer_log import project
+
+
+class Command(BaseCommand):
+    help = "Apply logged answers to AttemptAnswer/QuizAttempt (run continuously while ANSWER_LOG is enabled)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="project what is there and exit")
+        parser.add_argument('--interval', type=float, default=0.5, help="seconds between passes")
+        parser.add_argument('--batch-size', type=int, default=1000, help="events per transaction")
+
+    def handle(self, *args, **options):
+        while True:
+            applied = project(options['batch_size'])
+            if applied or options['once']:
+                self.stdout.write(f"projected {applied} answers")
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from quiz import bundles
+
+
+class Command(BaseCommand):
+    help = "Write content-hashed static bundles for every public quiz plus the catalogue index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-prune', action='store_true', help="keep bundles no longer in the catalogue")
+
+    def handle(self, *args, **options):
+        catalogue, removed = bundles.publish_all(prune=not options['no_prune'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {len(catalogue)} quizzes to {bundles.bundle_dir()} ({removed} stale bundles removed)"
+        ))
@@ -0,0 +1,15 @@
+import time
+from django.core.management.base import BaseCommand
+from quiz import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for quizzes and questions"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if not search.rebuild_index():
+            self.stdout.write(self.style.WARNING("Full-text search needs SQLite FTS5; nothing to rebuild."))
+            return
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt in {elapsed:.2f}s"))
@@ -0,0 +1,81 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from quiz import job_process, jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs and queue the periodic ones from settings.JOB_SCHEDULES"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="pool size (default: JOB_WORKERS)")
+        parser.add_argument('--processes', action='store_true',
+                            help="run jobs in a process pool instead of threads (for CPU-heavy jobs)")
+        parser.add_argument('--burst', action='store_true', help="exit once no job is due")
+        parser.add_argument('--no-schedules', action='store_true', help="don't queue periodic jobs")
+
+    def handle(self, *args, **options):
+        size = options['workers'] or settings.JOB_WORKERS
+        if options['processes']:
+            # spawn, not fork: a forked child would share the parent's open database connections
+            pool = ProcessPoolExecutor(size, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=job_process.setup)
+            execute = job_process.execute
+        else:
+            pool = ThreadPoolExecutor(size, thread_name_prefix='job')
+            execute = jobs.execute
+        worker = jobs.worker_name()
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        self.stdout.write(f"{worker}: running jobs with {size} {'processes' if options['processes'] else 'threads'}")
+
+        running = {}
+        last_heartbeat = time.monotonic()
+        try:
+            while not self.stopping:
+                close_old_connections()
+                if running and time.monotonic() - last_heartbeat >= settings.JOB_HEARTBEAT_INTERVAL:
+                    jobs.heartbeat(worker, list(running.values()))
+                    last_heartbeat = time.monotonic()
+                if not options['no_schedules']:
+                    for name in jobs.queue_due_schedules():
+                        self.stdout.write(f"queued periodic job {name}")
+                expired = jobs.requeue_expired()
+                if expired:
+                    self.stdout.write(self.style.WARNING(f"requeued {expired} jobs whose lease expired"))
+
+                for job_id in jobs.claim(worker, size - len(running)):
+                    running[pool.submit(execute, job_id)] = job_id
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(settings.JOB_POLL_INTERVAL)
+                    continue
+                done, _ = wait(running, timeout=settings.JOB_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.report(running.pop(future), future)
+        except KeyboardInterrupt:
+            self.stopping = True
+        finally:
+            # let claimed jobs finish; anything still running after a hard kill is retried once its lease expires
+            for future in list(running):
+                self.report(running.pop(future), future)
+            pool.shutdown()
+
+    def stop(self, signum, frame):
+        self.stdout.write("stopping after the running jobs finish")
+        self.stopping = True
+
+    def report(self, job_id, future):
+        try:
+            name, outcome, elapsed = future.result()
+        except Exception as exc:
+            # the job's own errors are recorded by execute(); this is the pool or the database failing
+            self.stdout.write(self.style.ERROR(f"job #{job_id} could not be run: {exc!r}"))
+            return
+        style = self.style.SUCCESS if outcome == 'done' else self.style.WARNING
+        self.stdout.write(style(f"{name} #{job_id} {outcome} in {elapsed * 1000:.1f}ms"))
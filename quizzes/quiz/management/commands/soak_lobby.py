@@ -0,0 +1,192 @@
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+import channels
+import quiz
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from quiz import metrics
+from quiz.consumers import LobbyConsumer
+
+# server-side memory: what the consumers, the lobby code and the channel layer hold on to; the interpreter's
+# own free lists and the simulated clients' queues are left out, they move with load rather than leaks
+SERVER_FILTERS = [
+    tracemalloc.Filter(True, os.path.join(os.path.dirname(quiz.__file__), '*')),
+    tracemalloc.Filter(True, os.path.join(os.path.dirname(channels.__file__), '*')),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+def server_memory():
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces(SERVER_FILTERS)
+    return sum(stat.size for stat in snapshot.statistics('filename'))
+
+
+# 5ms steps up to 2s, fine enough to hold a p99 limit to
+LATENCY_BUCKETS = tuple(ms / 1000 for ms in range(5, 2001, 5)) + (float('inf'),)
+
+
+class Client:
+    """Drives one LobbyConsumer through raw ASGI receive/send callables."""
+
+    def __init__(self, lobby_id, send_delay=0.0, spam_rate=0, oversized=False):
+        self.lobby_id = lobby_id
+        self.send_delay = send_delay
+        self.spam_rate = spam_rate
+        self.oversized = oversized
+        self.inbound = asyncio.Queue()
+        self.latencies = []
+        self.closed = False
+
+    async def receive(self):
+        return await self.inbound.get()
+
+    async def send(self, message):
+        if message['type'] == 'websocket.close':
+            self.closed = True
+        elif message['type'] == 'websocket.send':
+            if self.send_delay:
+                await asyncio.sleep(self.send_delay)
+            event = json.loads(message['text'])
+            self.latencies.append(time.time() - event['sent_at'])
+
+    async def run(self):
+        scope = {
+            'type': 'websocket',
+            'path': f'/ws/lobby/{self.lobby_id}/',
+            'url_route': {'args': (), 'kwargs': {'lobby_id': str(self.lobby_id)}},
+            'headers': [],
+        }
+        await self.inbound.put({'type': 'websocket.connect'})
+        app = LobbyConsumer.as_asgi()
+        task = asyncio.ensure_future(app(scope, self.receive, self.send))
+        try:
+            while not self.closed:
+                if self.oversized:
+                    await self.inbound.put({'type': 'websocket.receive', 'text': 'x' * 100000})
+                    self.oversized = False
+                if self.spam_rate:
+                    await self.inbound.put({'type': 'websocket.receive', 'text': '{"type": "ping"}'})
+                    await asyncio.sleep(1 / self.spam_rate)
+                else:
+                    await asyncio.sleep(0.1)
+        finally:
+            await self.inbound.put({'type': 'websocket.disconnect', 'code': 1000})
+            await asyncio.wait([task], timeout=1)
+            task.cancel()
+
+
+class Command(BaseCommand):
+    help = ("Soak-test lobby sockets with normal, slow and abusive clients; report memory and latency "
+            "and fail if the limits did not hold")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=int, default=10)
+        parser.add_argument('--normal', type=int, default=20)
+        parser.add_argument('--slow', type=int, default=10, help="clients that take 50ms to accept each frame")
+        parser.add_argument('--abusive', type=int, default=5, help="clients spamming 200 frames/s")
+        parser.add_argument('--rate', type=int, default=100, help="score updates broadcast per second")
+        parser.add_argument('--max-p99-ms', type=float, default=250.0, help="for normal clients")
+        parser.add_argument('--memory-noise-kib', type=int, default=256,
+                            help="allowed growth of server-side memory over the second half of the run")
+
+    def handle(self, *args, **options):
+        layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                              'CONFIG': {'capacity': 1000}}}
+        with override_settings(CHANNEL_LAYERS=layers):
+            asyncio.run(self.soak(options))
+
+    async def soak(self, options):
+        if options['seconds'] < 4:
+            raise CommandError("--seconds must be at least 4 to tell whether memory levels off")
+        lobby_id = 'soak'
+        metrics.reset()
+        normal = [Client(lobby_id) for _ in range(options['normal'])]
+        slow = [Client(lobby_id, send_delay=0.05) for _ in range(options['slow'])]
+        abusive = [Client(lobby_id, spam_rate=200) for _ in range(options['abusive'])]
+        abusive.append(Client(lobby_id, oversized=True))
+        clients = normal + slow + abusive
+
+        tracemalloc.start()
+        tasks = [asyncio.ensure_future(c.run()) for c in clients]
+        await asyncio.sleep(0.5)
+
+        channel_layer = get_channel_layer()
+        rng = random.Random(0)
+        interval = 1 / options['rate']
+        # snapshots pause the loop, so only take them at the start, middle and end of the run and let the
+        # backlog drain before the next second is measured
+        memory = [await self.checkpoint()]
+        # a fixed-size histogram, so the run's own bookkeeping doesn't grow the traced memory
+        all_latencies = metrics.Histogram(LATENCY_BUCKETS)
+        self.stdout.write(" sec   traced KiB   p50 ms   p99 ms")
+        for second in range(options['seconds']):
+            for c in clients:
+                c.latencies.clear()
+            end = time.perf_counter() + 1
+            while time.perf_counter() < end:
+                await channel_layer.group_send(f'lobby_{lobby_id}', {
+                    'type': 'score_update', 'user_id': rng.randint(1, 100), 'question_id': 1,
+                    'answer': 'A', 'score': 1, 'sent_at': time.time(),
+                })
+                await asyncio.sleep(interval)
+            latencies = sorted(l for c in normal for l in c.latencies) or [0]
+            for latency in latencies:
+                all_latencies.observe(latency)
+            self.stdout.write(
+                f"{second + 1:>4} {tracemalloc.get_traced_memory()[0] / 1024:>12.0f} "
+                f"{statistics.median(latencies) * 1000:>8.2f} {latencies[int(len(latencies) * 0.99) - 1] * 1000:>8.2f}"
+            )
+            if second + 1 == options['seconds'] // 2:
+                memory.append(await self.checkpoint())
+
+        oversized_closed = abusive[-1].closed
+        starved = [c for c in normal if not c.latencies]
+        memory.append(await self.checkpoint())
+        for c in clients:
+            c.closed = True
+        await asyncio.gather(*tasks, return_exceptions=True)
+        tracemalloc.stop()
+        snapshot = metrics.snapshot()
+        self.stdout.write(json.dumps(snapshot, indent=2))
+        self.verify(options, snapshot['lobbies'].get(lobby_id, {}), memory, all_latencies, oversized_closed, starved)
+
+    async def checkpoint(self):
+        current = server_memory()
+        await asyncio.sleep(0.5)
+        return current
+
+    def verify(self, options, counters, memory, latencies, oversized_closed, starved):
+        failures = []
+        # steady means the growth levels off: queues and buffers fill up in the first half, then stay put
+        start, middle, end = memory
+        warmup = (middle - start) / 1024
+        growth = (end - middle) / 1024
+        if growth > options['memory_noise_kib']:
+            failures.append(f"memory still grew {growth:.0f} KiB over the second half of the run "
+                            f"(first half {warmup:.0f} KiB, limit {options['memory_noise_kib']})")
+        p99 = latencies.quantile(0.99) * 1000
+        if p99 > options['max_p99_ms']:
+            failures.append(f"normal clients p99 {p99:.1f} ms (limit {options['max_p99_ms']:.0f})")
+        if starved:
+            failures.append(f"{len(starved)} normal clients received nothing in the last second")
+        if options['abusive'] and not counters.get('rate_limited'):
+            failures.append("spamming clients were never rate limited")
+        if not oversized_closed or counters.get('oversized') != 1:
+            failures.append("the oversized frame did not close its socket")
+        if options['slow'] and not (counters.get('merged') or counters.get('dropped')):
+            failures.append("slow clients never had frames merged or dropped")
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f"limits held: memory +{warmup:.0f} KiB then +{growth:.0f} KiB, normal p99 under {p99:.1f} ms, "
+            f"{counters.get('rate_limited', 0)} frames rate limited, "
+            f"{counters.get('merged', 0)} merged / {counters.get('dropped', 0)} dropped for slow clients"
+        ))
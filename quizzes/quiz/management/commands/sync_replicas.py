@@ -0,0 +1,28 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into every file-based replica (local stand-in for replication)"
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replicas only works with SQLite; use the database's own replication instead")
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write(self.style.WARNING("No replicas configured (set DATABASE_REPLICAS)."))
+            return
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias} <- default")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS("Replicas synced"))
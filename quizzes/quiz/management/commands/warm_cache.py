@@ -0,0 +1,17 @@
+import json
+from django.core.management.base import BaseCommand
+from quiz.warmup import warm
+
+
+class Command(BaseCommand):
+    help = "Preload quiz payloads, answer keys, today's challenge and the busiest leaderboards into the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--time-budget', type=float, default=None, help="seconds (default: settings)")
+        parser.add_argument('--memory-budget', type=int, default=None, help="bytes (default: settings)")
+        parser.add_argument('--leaderboards', type=int, default=None, help="how many leaderboards to load")
+
+    def handle(self, *args, **options):
+        # the cache is shared, so warming it once per deploy serves every worker
+        report = warm(options['time_budget'], options['memory_budget'], options['leaderboards'])
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,322 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from . import metrics
+from .models import Lobby, GameSession
+from .sharding import get_registry, worker_channel
+
+logger = logging.getLogger(__name__)
+
+# Matchmaking for public lobbies.
+# Players wait in a FIFO queue per bucket, i.e. per (quiz id, lobby size). Each
+# bucket is owned by one worker, picked on the lobby hash ring (see
+# quiz/sharding.py), so a bucket's queue lives in exactly one process and
+# joins/leaves from other workers are forwarded to it. Every
+# MATCHMAKING_INTERVAL the owner takes full groups off its queues (and, after
+# MATCHMAKING_MAX_WAIT, smaller groups of at least MATCHMAKING_MIN_PLAYERS),
+# creates their Lobby and GameSession rows in one batch and sends each player a
+# match_found event. Lobbies that started with free seats are filled by later
+# joiners for MATCHMAKING_FILL_SECONDS.
+#
+# Cost per player: join, leave and match are O(1) dict/OrderedDict operations
+# plus one O(log n) heap push for the max-wait deadline.
+
+
+def bucket_key(bucket):
+    """Hash ring key of a (quiz_id, size) bucket."""
+    return f'matchmaking:{bucket[0]}:{bucket[1]}'
+
+
+class Ticket:
+    __slots__ = ('channel', 'bucket', 'user_id', 'joined_at')
+
+    def __init__(self, channel, bucket, user_id, joined_at):
+        self.channel = channel
+        self.bucket = bucket
+        self.user_id = user_id
+        self.joined_at = joined_at
+
+    def to_dict(self):
+        return {'channel': self.channel, 'quiz_id': self.bucket[0], 'size': self.bucket[1],
+                'user_id': self.user_id, 'joined_at': self.joined_at}
+
+
+class Match:
+    __slots__ = ('bucket', 'tickets', 'lobby_id', 'session_id')
+
+    def __init__(self, bucket, tickets, lobby_id=None, session_id=None):
+        self.bucket = bucket
+        self.tickets = tickets
+        # set for players filling an existing lobby, or once the new lobby's rows exist
+        self.lobby_id = lobby_id
+        self.session_id = session_id
+
+    @property
+    def free_seats(self):
+        return self.bucket[1] - len(self.tickets)
+
+
+class Matchmaker:
+    """The queues of the buckets this worker owns. Not thread safe: used from the event loop only."""
+
+    def __init__(self, sizes, min_players=2, max_wait=10.0, fill_seconds=30.0):
+        self.sizes = set(sizes)
+        self.min_players = min_players
+        self.max_wait = max_wait
+        self.fill_seconds = fill_seconds
+        self.queues = {}
+        self.tickets = {}
+        self.ready = set()
+        self.deadlines = []
+        self.open_lobbies = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def join(self, channel, quiz_id, size, user_id=None, joined_at=None):
+        if size not in self.sizes:
+            raise ValueError(f"lobby size must be one of {sorted(self.sizes)}")
+        if channel in self.tickets:
+            self.leave(channel)
+        bucket = (int(quiz_id), size)
+        ticket = Ticket(channel, bucket, user_id, time.time() if joined_at is None else joined_at)
+        queue = self.queues.get(bucket)
+        if queue is None:
+            queue = self.queues[bucket] = OrderedDict()
+        queue[channel] = ticket
+        self.tickets[channel] = ticket
+        heapq.heappush(self.deadlines, (ticket.joined_at + self.max_wait, next(self._seq), channel, ticket.joined_at))
+        if len(queue) >= size or self.open_lobbies.get(bucket) or self._overdue(queue, time.time()):
+            self.ready.add(bucket)
+        return ticket
+
+    def leave(self, channel):
+        ticket = self.tickets.pop(channel, None)
+        if ticket is None:
+            return False
+        queue = self.queues[ticket.bucket]
+        del queue[channel]
+        if not queue:
+            del self.queues[ticket.bucket]
+        # its deadline stays in the heap and is skipped when it comes up
+        return True
+
+    def _overdue(self, queue, now):
+        oldest = next(iter(queue.values()))
+        return len(queue) >= self.min_players and now - oldest.joined_at >= self.max_wait
+
+    def _take(self, queue, count):
+        tickets = []
+        for _ in range(count):
+            _, ticket = queue.popitem(last=False)
+            del self.tickets[ticket.channel]
+            tickets.append(ticket)
+        return tickets
+
+    def due(self, now=None):
+        """Take every group that can play now off the queues; new lobbies come back with lobby_id None."""
+        now = time.time() if now is None else now
+        buckets, self.ready = self.ready, set()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, _, channel, joined_at = heapq.heappop(self.deadlines)
+            ticket = self.tickets.get(channel)
+            if ticket is not None and ticket.joined_at == joined_at:
+                buckets.add(ticket.bucket)
+
+        matches = []
+        for bucket in buckets:
+            queue = self.queues.get(bucket)
+            if not queue:
+                continue
+            size = bucket[1]
+            matches += self._fill(bucket, queue, now)
+            while len(queue) >= size:
+                matches.append(Match(bucket, self._take(queue, size)))
+            if queue and self._overdue(queue, now):
+                matches.append(Match(bucket, self._take(queue, len(queue))))
+            if not queue:
+                del self.queues[bucket]
+        return matches
+
+    def _fill(self, bucket, queue, now):
+        lobbies = self.open_lobbies.get(bucket)
+        matches = []
+        while lobbies and queue:
+            lobby = lobbies[0]
+            if lobby[3] <= now:
+                lobbies.popleft()
+                continue
+            taken = self._take(queue, min(lobby[2], len(queue)))
+            matches.append(Match(bucket, taken, lobby[0], lobby[1]))
+            lobby[2] -= len(taken)
+            if not lobby[2]:
+                lobbies.popleft()
+        if not lobbies:
+            self.open_lobbies.pop(bucket, None)
+        return matches
+
+    def seated(self, match, now=None):
+        """Record a newly created lobby; if it has free seats, later joiners of its bucket fill them."""
+        if match.free_seats > 0:
+            now = time.time() if now is None else now
+            self.open_lobbies.setdefault(match.bucket, deque()).append(
+                [match.lobby_id, match.session_id, match.free_seats, now + self.fill_seconds])
+
+    def release(self, keep):
+        """Remove and return the tickets of buckets for which keep(bucket) is false (after a rebalance)."""
+        moved = []
+        for bucket in [b for b in self.queues if not keep(b)]:
+            for ticket in self.queues.pop(bucket).values():
+                del self.tickets[ticket.channel]
+                moved.append(ticket)
+            self.open_lobbies.pop(bucket, None)
+        return moved
+
+
+def create_lobbies(matches):
+    """Create the Lobby and GameSession rows for new matches, all in one transaction."""
+    hosts = [next((t.user_id for t in match.tickets if t.user_id is not None), None) for match in matches]
+    if None in hosts:
+        # anonymous players get a lobby hosted by the guest user, as in quiz_game
+        guest_id = get_user_model().objects.get_or_create(username="guest")[0].pk
+        hosts = [guest_id if host is None else host for host in hosts]
+    with transaction.atomic():
+        lobbies = Lobby.objects.bulk_create([
+            Lobby(name=f"Quick match: quiz {match.bucket[0]}", host_id=host, is_public=True)
+            for match, host in zip(matches, hosts)
+        ])
+        sessions = GameSession.objects.bulk_create([
+            GameSession(lobby=lobby, quiz_id=match.bucket[0]) for match, lobby in zip(matches, lobbies)
+        ])
+    for match, lobby, session in zip(matches, lobbies, sessions):
+        match.lobby_id = lobby.pk
+        match.session_id = session.pk
+
+
+def requeue(matchmaker, matches):
+    """Put players back where they were, e.g. when their lobby could not be created."""
+    for match in matches:
+        for ticket in match.tickets:
+            matchmaker.join(ticket.channel, *ticket.bucket, ticket.user_id, ticket.joined_at)
+
+
+def form_matches(matchmaker, now=None):
+    """due() plus creating the new lobbies, synchronously (the benchmark's path; run() splits it up)."""
+    now = time.time() if now is None else now
+    matches = matchmaker.due(now)
+    new = [match for match in matches if match.lobby_id is None]
+    if new:
+        try:
+            create_lobbies(new)
+        except Exception:
+            requeue(matchmaker, matches)
+            raise
+        for match in new:
+            matchmaker.seated(match, now)
+    return matches
+
+
+def match_event(match):
+    return {
+        'type': 'match.found',
+        'lobby_id': match.lobby_id,
+        'session_id': match.session_id,
+        'quiz_id': match.bucket[0],
+        'size': match.bucket[1],
+    }
+
+
+async def notify(channel_layer, matches):
+    now = time.time()
+    sends = []
+    for match in matches:
+        event = match_event(match)
+        for ticket in match.tickets:
+            metrics.observe('matchmaking_wait_seconds', max(now - ticket.joined_at, 0.0))
+            sends.append(channel_layer.send(ticket.channel, event))
+    await asyncio.gather(*sends)
+
+
+_matchmaker = None
+
+
+def get_matchmaker():
+    global _matchmaker
+    if _matchmaker is None:
+        _matchmaker = Matchmaker(settings.MATCHMAKING_LOBBY_SIZES, settings.MATCHMAKING_MIN_PLAYERS,
+                                 settings.MATCHMAKING_MAX_WAIT, settings.MATCHMAKING_FILL_SECONDS)
+    return _matchmaker
+
+
+async def join(channel_layer, ticket):
+    """Queue a player (ticket dict, see Ticket.to_dict) on the bucket owner, forwarding it there if needed."""
+    bucket = (int(ticket['quiz_id']), int(ticket['size']))
+    registry = get_registry()
+    owner = registry.owner(bucket_key(bucket))
+    if owner != registry.worker:
+        await channel_layer.send(worker_channel(owner), dict(ticket, type='matchmaking.join'))
+        return
+    get_matchmaker().join(ticket['channel'], *bucket, ticket.get('user_id'), ticket.get('joined_at'))
+
+
+async def leave(channel_layer, channel, bucket):
+    registry = get_registry()
+    owner = registry.owner(bucket_key(bucket))
+    if owner != registry.worker:
+        await channel_layer.send(worker_channel(owner), {'type': 'matchmaking.leave', 'channel': channel})
+        return
+    get_matchmaker().leave(channel)
+
+
+async def hand_off(channel_layer):
+    """After a rebalance, move waiting players of buckets this worker no longer owns to their new owner."""
+    registry = get_registry()
+    if not len(registry.ring):
+        return
+    moved = get_matchmaker().release(lambda bucket: registry.owns(bucket_key(bucket)))
+    for ticket in moved:
+        await join(channel_layer, ticket.to_dict())
+
+
+async def run(channel_layer, interval):
+    matchmaker = get_matchmaker()
+    create = sync_to_async(create_lobbies)
+    while True:
+        await asyncio.sleep(interval)
+        start = time.perf_counter()
+        # the queues are only touched on the event loop; just the row inserts go to a thread
+        matches = matchmaker.due()
+        new = [match for match in matches if match.lobby_id is None]
+        if new:
+            try:
+                await create(new)
+            except Exception:
+                logger.exception('could not create lobbies for matched players')
+                requeue(matchmaker, matches)
+                continue
+            for match in new:
+                matchmaker.seated(match)
+        if matches:
+            await notify(channel_layer, matches)
+            metrics.observe('matchmaking_tick_seconds', time.perf_counter() - start)
+        metrics.set_gauge('matchmaking_waiting', len(matchmaker))
+
+
+_task = None
+
+
+def ensure_running(channel_layer):
+    """Start this process's matchmaking loop unless it is running: at startup (see quiz/lifespan.py),
+    and again from matchmaking sockets in case it has stopped."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(run(channel_layer, settings.MATCHMAKING_INTERVAL))
+    return _task
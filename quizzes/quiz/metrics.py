@@ -0,0 +1,85 @@
+import bisect
+from collections import Counter, defaultdict
+
+# In-process metrics for HTTP views and the lobby WebSocket side, served by MetricsView.
+# Each worker process reports its own numbers.
+
+# upper bounds in seconds; the last bucket catches everything slower
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+lobby_counters = defaultdict(Counter)
+histograms = {}
+gauges = {}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound if bound != float('inf') else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': {('+Inf' if b == float('inf') else str(b)): n for b, n in zip(self.buckets, self.counts)},
+        }
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}={v}' for k, v in sorted(labels.items())) + '}'
+
+
+def incr_lobby(lobby_id, name, amount=1):
+    lobby_counters[str(lobby_id)][name] += amount
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = Histogram()
+    histogram.observe(value)
+
+
+def set_gauge(name, value, **labels):
+    gauges[_key(name, labels)] = value
+
+
+def snapshot():
+    return {
+        'lobbies': {lobby_id: dict(counts) for lobby_id, counts in lobby_counters.items()},
+        'histograms': {key: h.to_dict() for key, h in sorted(histograms.items())},
+        'gauges': dict(sorted(gauges.items())),
+    }
+
+
+def reset():
+    lobby_counters.clear()
+    histograms.clear()
+    gauges.clear()
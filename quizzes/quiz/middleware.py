@@ -0,0 +1,19 @@
+import time
+from . import instrumentation, metrics
+
+
+class RequestTimingMiddleware:
+    """Records http_request_seconds per URL name while instrumentation is switched on."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not instrumentation.enabled():
+            return self.get_response(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unresolved'
+        metrics.observe('http_request_seconds', time.perf_counter() - start, view=view)
+        return response
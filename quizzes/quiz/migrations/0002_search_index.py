@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# FTS5 tables use external content so the text is not stored twice; the
+# triggers keep them in sync with every insert/update/delete, including
+# bulk_create and cascaded deletes.
+FORWARD_SQL = [
+    "CREATE VIRTUAL TABLE quiz_quiz_fts USING fts5(title, content='quiz_quiz', content_rowid='id')",
+    "CREATE VIRTUAL TABLE quiz_question_fts USING fts5(text, content='quiz_question', content_rowid='id')",
+    """CREATE TRIGGER quiz_quiz_fts_ai AFTER INSERT ON quiz_quiz BEGIN
+        INSERT INTO quiz_quiz_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER quiz_quiz_fts_ad AFTER DELETE ON quiz_quiz BEGIN
+        INSERT INTO quiz_quiz_fts(quiz_quiz_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER quiz_quiz_fts_au AFTER UPDATE OF title ON quiz_quiz BEGIN
+        INSERT INTO quiz_quiz_fts(quiz_quiz_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO quiz_quiz_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER quiz_question_fts_ai AFTER INSERT ON quiz_question BEGIN
+        INSERT INTO quiz_question_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER quiz_question_fts_ad AFTER DELETE ON quiz_question BEGIN
+        INSERT INTO quiz_question_fts(quiz_question_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER quiz_question_fts_au AFTER UPDATE OF text ON quiz_question BEGIN
+        INSERT INTO quiz_question_fts(quiz_question_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO quiz_question_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    "INSERT INTO quiz_quiz_fts(quiz_quiz_fts) VALUES ('rebuild')",
+    "INSERT INTO quiz_question_fts(quiz_question_fts) VALUES ('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS quiz_quiz_fts_ai",
+    "DROP TRIGGER IF EXISTS quiz_quiz_fts_ad",
+    "DROP TRIGGER IF EXISTS quiz_quiz_fts_au",
+    "DROP TRIGGER IF EXISTS quiz_question_fts_ai",
+    "DROP TRIGGER IF EXISTS quiz_question_fts_ad",
+    "DROP TRIGGER IF EXISTS quiz_question_fts_au",
+    "DROP TABLE IF EXISTS quiz_quiz_fts",
+    "DROP TABLE IF EXISTS quiz_question_fts",
+]
+
+
+def run_statements(statements):
+    def apply(apps, schema_editor):
+        # FTS5 is SQLite-only; other backends fall back to icontains in quiz.search
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(FORWARD_SQL), run_statements(REVERSE_SQL)),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerLogCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('writer', models.CharField(max_length=255, unique=True)),
+                ('seq', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
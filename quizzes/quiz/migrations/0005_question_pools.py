@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0004_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='pool_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='question_ids',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='seed',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Prefix indexes for 2- and 3-character prefixes, so a short last word ("ka*")
+# reads one doclist instead of merging those of every word starting with it.
+# The triggers from 0002 only name the tables, so they keep working.
+
+
+def recreate(prefix):
+    options = f", prefix='{prefix}'" if prefix else ''
+    statements = [
+        "DROP TABLE IF EXISTS quiz_quiz_fts",
+        "DROP TABLE IF EXISTS quiz_question_fts",
+        f"CREATE VIRTUAL TABLE quiz_quiz_fts USING fts5(title, content='quiz_quiz', content_rowid='id'{options})",
+        f"CREATE VIRTUAL TABLE quiz_question_fts USING fts5(text, content='quiz_question', content_rowid='id'{options})",
+        "INSERT INTO quiz_quiz_fts(quiz_quiz_fts) VALUES ('rebuild')",
+        "INSERT INTO quiz_question_fts(quiz_question_fts) VALUES ('rebuild')",
+    ]
+
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0005_question_pools'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate('2 3'), recreate(None)),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0006_search_prefix_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attemptanswer',
+            name='log_seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attemptanswer',
+            name='log_writer',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
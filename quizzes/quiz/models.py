@@ -11,6 +11,8 @@ class Quiz(models.Model):
     is_timed = models.BooleanField(default=False)
     time_limit_seconds = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # question-pool mode: each attempt plays this many questions drawn at random from the quiz
+    pool_size = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.title
@@ -45,6 +47,9 @@ class QuizAttempt(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     score = models.PositiveIntegerField(default=0)
     time_taken_seconds = models.PositiveIntegerField(null=True, blank=True)
+    # pool-mode draw (see quiz/pools.py): the seed and the question ids it picked, in play order
+    seed = models.BigIntegerField(null=True, blank=True)
+    question_ids = models.JSONField(null=True, blank=True)
 
 
 class AttemptAnswer(models.Model):
@@ -52,6 +57,9 @@ class AttemptAnswer(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     selected_answer = models.CharField(max_length=200)
     is_correct = models.BooleanField(default=False)
+    # the answer-log event this row was projected from, if any (see quiz/answer_log.py)
+    log_writer = models.CharField(max_length=255, blank=True)
+    log_seq = models.BigIntegerField(null=True, blank=True)
 
 
 class Lobby(models.Model):
@@ -90,4 +98,60 @@ class DailyChallenge(models.Model):
     date = models.DateField(unique=True)
 
 
+class AnswerLogCheckpoint(models.Model):
+    """Last answer-log sequence number applied to the tables, per log writer (see quiz/answer_log.py)."""
+    writer = models.CharField(max_length=255, unique=True)
+    seq = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
+    def __str__(self):
+        return f"{self.writer} @ {self.seq}"
+
+
+class Job(models.Model):
+    """Deferred work for `manage.py run_jobs` (see quiz/jobs.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # refreshed by the worker while the job runs; a stale one means the worker is gone
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+        constraints = [
+            # only one job per key can be waiting; once it starts, a new one may queue behind it
+            models.UniqueConstraint(fields=['dedupe_key'], condition=models.Q(status='queued'),
+                                    name='quiz_job_queued_dedupe_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class JobSchedule(models.Model):
+    """When a periodic job from settings.JOB_SCHEDULES is next due."""
+    name = models.CharField(max_length=100, unique=True)
+    next_run_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.next_run_at}"
@@ -0,0 +1,78 @@
+import random
+from .models import Question, QuizAttempt
+
+# Question pools.
+# A quiz with pool_size set is played as a random subset of its questions: each
+# attempt stores a seed and the pool_size question ids drawn with it, in play
+# order, so a page view only touches the attempt's own ids and fetches the
+# current question by primary key, however large the pool.
+#
+# The draw samples random ids in the pool's id range and keeps those that are
+# questions of the quiz, so it costs a few index lookups per drawn question
+# instead of reading (or counting) every id. Small id ranges, and ranges where
+# too few probes hit, fall back to reading the ids.
+
+# below this share of probed ids belonging to the quiz, reading the ids is cheaper than probing
+MIN_DENSITY = 0.05
+
+
+def _probe(questions, size, low, high, rng):
+    """Draw by probing random ids in [low, high]; None when too few of them are questions of the quiz."""
+    span = high - low + 1
+    chosen, tried, hits = [], set(), 0
+    while len(chosen) < size:
+        if tried and (hits / len(tried) < MIN_DENSITY or len(tried) >= span):
+            return None
+        density = hits / len(tried) if tried else 1.0
+        # oversample by the density seen so far, so a round or two is enough
+        want = int((size - len(chosen)) / max(density, MIN_DENSITY) * 1.25) + 4
+        candidates = []
+        while len(candidates) < want and len(tried) < span:
+            candidate = rng.randrange(low, high + 1)
+            if candidate not in tried:
+                tried.add(candidate)
+                candidates.append(candidate)
+        found = set(questions.filter(id__in=candidates).values_list('id', flat=True))
+        hits += len(found)
+        chosen += [c for c in candidates if c in found][:size - len(chosen)]
+    return chosen
+
+
+def draw(quiz_id, size, seed):
+    """The question ids a play with this seed gets: a random subset of `size`, in play order."""
+    rng = random.Random(seed)
+    questions = Question.objects.filter(quiz_id=quiz_id)
+    # two index seeks; an aggregate with Count would walk the quiz's whole index range
+    low = questions.order_by('id').values_list('id', flat=True).first()
+    if low is None:
+        return []
+    high = questions.order_by('-id').values_list('id', flat=True).first()
+    if high - low + 1 > size * 4:
+        chosen = _probe(questions, size, low, high, rng)
+        if chosen is not None:
+            return chosen
+    ids = list(questions.order_by('id').values_list('id', flat=True))
+    return rng.sample(ids, min(size, len(ids)))
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+
+
+def start_attempt(user, quiz):
+    """Create an attempt; in pool mode it gets its seed and drawn question ids."""
+    attempt = QuizAttempt(user=user, quiz=quiz)
+    if quiz.pool_size:
+        attempt.seed = new_seed()
+        attempt.question_ids = draw(quiz.id, quiz.pool_size, attempt.seed)
+    attempt.save()
+    return attempt
+
+
+def question_ids(attempt):
+    """Ids of the questions this attempt plays, in order."""
+    if attempt.question_ids is None:
+        return list(Question.objects.filter(quiz_id=attempt.quiz_id).order_by('id').values_list('id', flat=True))
+    # questions deleted since the draw are skipped
+    existing = set(Question.objects.filter(pk__in=attempt.question_ids).values_list('id', flat=True))
+    return [question_id for question_id in attempt.question_ids if question_id in existing]
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from django.utils import timezone
+from .models import Quiz, Question, LeaderboardEntry, DailyChallenge
+
+# Lean read models for the hot list endpoints.
+# Rows come straight from .values() projections instead of model instances run
+# through ModelSerializer, but the output is the same as the matching
+# serializer in quiz/serializers.py (same keys, foreign keys as ids, datetimes
+# in the current time zone), so clients and cached payloads don't change.
+
+QUESTION_FIELDS = ('id', 'text', 'question_type', 'correct_answer',
+                   'option_a', 'option_b', 'option_c', 'option_d', 'quiz')
+QUIZ_FIELDS = ('id', 'title', 'is_public', 'is_timed', 'time_limit_seconds', 'created_at', 'pool_size', 'creator')
+LEADERBOARD_FIELDS = ('id', 'score', 'time_taken_seconds', 'created_at', 'quiz', 'user')
+
+LEADERBOARD_ORDER = ('-score', 'time_taken_seconds')
+
+
+def format_datetime(value, tz=None):
+    """Same string DRF's DateTimeField produces."""
+    if value is None:
+        return None
+    value = value.astimezone(tz or timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _format_rows(rows, *date_fields):
+    # looking the time zone up once instead of per row (localtime()) is most of the saving on long lists
+    tz = timezone.get_current_timezone()
+    for row in rows:
+        for field in date_fields:
+            row[field] = format_datetime(row[field], tz)
+        yield row
+
+
+def question_rows(quiz_ids):
+    """{quiz_id: [question, ...]} for the given quizzes, one query."""
+    grouped = defaultdict(list)
+    for row in Question.objects.filter(quiz_id__in=quiz_ids).order_by('id').values(*QUESTION_FIELDS):
+        grouped[row['quiz']].append(row)
+    return grouped
+
+
+def quiz_payloads(quiz_ids):
+    """{quiz_id: payload shaped like QuizSerializer}, two queries however many quizzes."""
+    questions = question_rows(quiz_ids)
+    payloads = {}
+    for row in _format_rows(Quiz.objects.filter(pk__in=quiz_ids).values(*QUIZ_FIELDS), 'created_at'):
+        quiz_id = row.pop('id')
+        payload = payloads[quiz_id] = {'id': quiz_id, 'questions': questions.get(quiz_id, [])}
+        payload.update(row)
+    return payloads
+
+
+def leaderboard_queryset(quiz_id):
+    return LeaderboardEntry.objects.filter(quiz_id=quiz_id).order_by(*LEADERBOARD_ORDER).values(*LEADERBOARD_FIELDS)
+
+
+def leaderboard_rows(quiz_id, chunk_size=None):
+    """Leaderboard rows shaped like LeaderboardEntrySerializer; pass chunk_size to iterate without caching."""
+    queryset = leaderboard_queryset(quiz_id)
+    if chunk_size:
+        queryset = queryset.iterator(chunk_size=chunk_size)
+    return _format_rows(queryset, 'created_at')
+
+
+def daily_challenge_payload(date):
+    """Shaped like DailyChallengeSerializer, including its {'date': None} when there is no challenge."""
+    challenge = DailyChallenge.objects.filter(date=date).values('id', 'quiz', 'date').first()
+    if challenge is None:
+        return {'date': None}
+    quiz = quiz_payloads([challenge['quiz']]).get(challenge['quiz'])
+    return {'id': challenge['id'], 'quiz': quiz, 'date': challenge['date'].isoformat()}
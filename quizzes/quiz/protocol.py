@@ -0,0 +1,91 @@
+import json
+import struct
+
+# Compact binary framing for lobby sockets, negotiated with the
+# `trivia.packed.v1` WebSocket subprotocol. Clients that don't ask for it keep
+# getting JSON text frames.
+#
+# Every frame starts with a one-byte kind, followed by big-endian fields:
+#   SCORE_UPDATE   user_id u32, question_id u32, score u32, answer_id u16
+#   DEFINE_ANSWER  answer_id u16, answer utf-8 (rest of frame)
+#   ANSWER         user_id u32, quiz_id u32, question_id u32, answer utf-8 (client -> server)
+#
+# Answer strings are sent once per connection as DEFINE_ANSWER frames and then
+# referred to by the per-lobby id kept in LobbyState.
+
+SUBPROTOCOL = 'trivia.packed.v1'
+
+SCORE_UPDATE = 1
+DEFINE_ANSWER = 2
+ANSWER = 3
+
+MAX_ANSWER_ID = 0xFFFF
+
+_score_update = struct.Struct('!BIIIH')
+_define_answer = struct.Struct('!BH')
+_answer = struct.Struct('!BIII')
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_score_update(user_id, question_id, score, answer_id):
+    return _score_update.pack(SCORE_UPDATE, user_id, question_id, score, answer_id)
+
+
+def encode_define_answer(answer_id, answer):
+    return _define_answer.pack(DEFINE_ANSWER, answer_id) + answer.encode()
+
+
+def encode_answer(user_id, quiz_id, question_id, answer):
+    return _answer.pack(ANSWER, user_id, quiz_id, question_id) + answer.encode()
+
+
+def decode_answer(frame):
+    if len(frame) < _answer.size or frame[0] != ANSWER:
+        raise ProtocolError('not an answer frame')
+    _, user_id, quiz_id, question_id = _answer.unpack_from(frame)
+    try:
+        answer = frame[_answer.size:].decode()
+    except UnicodeDecodeError:
+        raise ProtocolError('answer is not valid utf-8')
+    return {'type': 'answer', 'user_id': user_id, 'quiz_id': quiz_id, 'question_id': question_id, 'answer': answer}
+
+
+def decode_server_frame(frame):
+    """Decode a SCORE_UPDATE or DEFINE_ANSWER frame, as a client would."""
+    if frame[:1] == bytes([SCORE_UPDATE]) and len(frame) == _score_update.size:
+        _, user_id, question_id, score, answer_id = _score_update.unpack(frame)
+        return {'type': 'score_update', 'user_id': user_id, 'question_id': question_id, 'score': score,
+                'answer_id': answer_id}
+    if frame[:1] == bytes([DEFINE_ANSWER]) and len(frame) >= _define_answer.size:
+        _, answer_id = _define_answer.unpack_from(frame)
+        try:
+            answer = frame[_define_answer.size:].decode()
+        except UnicodeDecodeError:
+            raise ProtocolError('answer is not valid utf-8')
+        return {'type': 'define_answer', 'answer_id': answer_id, 'answer': answer}
+    raise ProtocolError('not a server frame')
+
+
+def build_score_event(user_id, question_id, answer, score, answer_id=None):
+    """Build the group_send event for a score update with both wire formats encoded once.
+
+    Every recipient reuses `text` or `packed` as-is; `packed` is None when the
+    values don't fit the binary layout, in which case packed clients get the text frame.
+    """
+    event = {
+        'type': 'score_update',
+        'user_id': user_id,
+        'question_id': question_id,
+        'answer': answer,
+        'score': score,
+    }
+    event['text'] = json.dumps(event)
+    event['answer_id'] = answer_id
+    try:
+        event['packed'] = None if answer_id is None else encode_score_update(user_id, question_id, score, answer_id)
+    except struct.error:
+        event['packed'] = None
+    return event
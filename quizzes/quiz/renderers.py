@@ -0,0 +1,77 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .routers import bind_current_routing
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+# Faster JSON output for the API. With orjson installed, responses are encoded
+# in C (datetimes, UUIDs and dict subclasses such as ReturnDict natively);
+# anything orjson can't handle goes through DRF's own encoder, so the output
+# matches JSONRenderer. Large lists can be streamed with stream_json_list().
+
+_fallback = JSONEncoder()
+
+
+def _default(obj):
+    return _fallback.default(obj)
+
+
+def dumps(data):
+    if orjson is None:
+        return JSONRenderer().render(data)
+    content = orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    # same escaping as JSONRenderer, so the output is safe to inline in a <script>
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # indented output (e.g. "Accept: application/json; indent=4") is rare; leave it to DRF
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+def iter_json_list(rows, batch_size=500):
+    """Encode an iterable of rows as one JSON array, a batch of rows per chunk."""
+    yield b'['
+    batch, first = [], True
+    for row in rows:
+        batch.append(dumps(row))
+        if len(batch) >= batch_size:
+            yield (b'' if first else b',') + b','.join(batch)
+            batch, first = [], False
+    if batch:
+        yield (b'' if first else b',') + b','.join(batch)
+    yield b']'
+
+
+async def _aiter_chunks(chunks):
+    # the ORM is sync: pull each chunk in the shared sync thread, which also keeps the DB cursor on one connection
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def stream_json_list(request, rows, batch_size=500):
+    """A response that writes the rows out as they are read, never holding the whole list.
+
+    Under ASGI the body must be an async iterator, or Django would read it all into memory first.
+    """
+    chunks = bind_current_routing(iter_json_list(rows, batch_size))
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _aiter_chunks(chunks)
+    return StreamingHttpResponse(chunks, content_type='application/json')
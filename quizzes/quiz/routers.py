@@ -0,0 +1,86 @@
+import contextvars
+import random
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+
+# Read-replica routing.
+# Only views wrapped in @read_from_replica send their reads to a replica, so the
+# attempt/answer flow never leaves the primary. Inside a replica-enabled view, the
+# first write pins every later read of the same request to the primary, so a
+# request always sees its own writes.
+
+_routing = contextvars.ContextVar('quiz_db_routing', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        # sessions and auth stay on the primary: a just-created session may not have replicated yet
+        if state is None or state['pinned'] or model._meta.app_label != 'quiz':
+            return 'default'
+        return state['alias']
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state['pinned'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas are copies of the primary, so objects from any of them can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary (see the sync_replicas command)
+        return db == 'default'
+
+
+def read_from_replica(view):
+    """Route the view's reads to a replica picked once per request, if any are configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            return view(*args, **kwargs)
+        token = _routing.set({'alias': random.choice(replicas), 'pinned': False})
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _routing.reset(token)
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Send every read in the block to the primary, even inside a replica-enabled view.
+
+    For data that outlives the request, like cache entries: a lagging replica would put
+    rows back in the cache that a write has just invalidated.
+    """
+    token = _routing.set(None)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+_END = object()
+
+
+def bind_current_routing(iterable):
+    """Iterate under this request's routing even after the view has returned (streamed response bodies)."""
+    state = _routing.get()
+    iterator = iter(iterable)
+
+    def generate():
+        while True:
+            token = _routing.set(state)
+            try:
+                item = next(iterator, _END)
+            finally:
+                _routing.reset(token)
+            if item is _END:
+                return
+            yield item
+    return generate()
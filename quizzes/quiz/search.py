@@ -0,0 +1,201 @@
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Quiz, Question
+
+# Full-text search over public quizzes and their questions.
+# On SQLite this uses the FTS5 tables created in migration 0002 (kept in sync
+# by triggers, with 2- and 3-character prefix indexes since 0006); on any other
+# backend it falls back to an icontains scan.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# deeper pages cost an OFFSET scan per request; nobody pages this far through search results
+MAX_PAGE = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# the last word is matched as a prefix only from this length on; a shorter one must match
+# whole (a one-letter prefix matches most of the index)
+MIN_PREFIX_LENGTH = 2
+
+# bm25 reads the whole match list of every term (for its idf), so a common word or short
+# prefix costs as much as the rows it matches. Queries matching more questions than this are
+# too broad to rank usefully anyway: they get the newest matches, quizzes first.
+MAX_RANKED_MATCHES = 5000
+
+COUNT_SQL = """
+    SELECT count(*) FROM (
+        SELECT rowid FROM quiz_question_fts WHERE quiz_question_fts MATCH %s LIMIT %s
+    )
+"""
+
+RANKED_SQL = """
+    SELECT kind, quiz_id, question_id, title, text FROM (
+        SELECT * FROM (
+            SELECT 'quiz' AS kind, q.id AS quiz_id, NULL AS question_id, q.title AS title, NULL AS text,
+                   bm25(quiz_quiz_fts) AS score
+            FROM quiz_quiz_fts
+            JOIN quiz_quiz q ON q.id = quiz_quiz_fts.rowid
+            WHERE quiz_quiz_fts MATCH %s AND q.is_public
+            ORDER BY quiz_quiz_fts.rowid DESC
+            LIMIT %s
+        )
+        UNION ALL
+        SELECT 'question', q.id, qu.id, q.title, qu.text, bm25(quiz_question_fts)
+        FROM quiz_question_fts
+        JOIN quiz_question qu ON qu.id = quiz_question_fts.rowid
+        JOIN quiz_quiz q ON q.id = qu.quiz_id
+        WHERE quiz_question_fts MATCH %s AND q.is_public
+    )
+    ORDER BY score
+    LIMIT %s OFFSET %s
+"""
+
+NEWEST_SQL = """
+    SELECT kind, quiz_id, question_id, title, text FROM (
+        SELECT * FROM (
+            SELECT 'quiz' AS kind, q.id AS quiz_id, NULL AS question_id, q.title AS title, NULL AS text,
+                   0 AS grp, quiz_quiz_fts.rowid AS pos
+            FROM quiz_quiz_fts
+            JOIN quiz_quiz q ON q.id = quiz_quiz_fts.rowid
+            WHERE quiz_quiz_fts MATCH %s AND q.is_public
+            ORDER BY quiz_quiz_fts.rowid DESC
+            LIMIT %s
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'question', q.id, qu.id, q.title, qu.text, 1, quiz_question_fts.rowid
+            FROM quiz_question_fts
+            JOIN quiz_question qu ON qu.id = quiz_question_fts.rowid
+            JOIN quiz_quiz q ON q.id = qu.quiz_id
+            WHERE quiz_question_fts MATCH %s AND q.is_public
+            ORDER BY quiz_question_fts.rowid DESC
+            LIMIT %s
+        )
+    )
+    ORDER BY grp, pos DESC
+    LIMIT %s OFFSET %s
+"""
+
+SNIPPET_WORDS = 12
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def query_terms(text):
+    """The words of a query, lowercased, and whether the last one is matched as a prefix."""
+    tokens = [t.lower() for t in TOKEN_RE.findall(text or '')]
+    return tokens, bool(tokens) and len(tokens[-1]) >= MIN_PREFIX_LENGTH
+
+
+def build_match_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, the last as a prefix if long enough."""
+    tokens, prefix = query_terms(text)
+    if not tokens:
+        return ''
+    terms = [f'"{t}"' for t in tokens]
+    if prefix:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def make_snippet(text, tokens, prefix, size=SNIPPET_WORDS):
+    """The `size` words of text with the most matches, matches in [brackets], like FTS5's snippet().
+
+    Built here rather than with snippet() because FTS5 redoes a prefix query for every rowid it is
+    asked about, which costs as much as the query itself for a common prefix.
+    """
+    words = list(TOKEN_RE.finditer(text))
+    if not words:
+        return text
+    whole = set(tokens[:-1] if prefix else tokens)
+    hits = [
+        w.group().lower() in whole or (prefix and w.group().lower().startswith(tokens[-1]))
+        for w in words
+    ]
+    start = max(range(max(len(words) - size, 0) + 1), key=lambda i: sum(hits[i:i + size]))
+    end = min(start + size, len(words))
+    parts, pos = [], words[start].start()
+    for word, hit in zip(words[start:end], hits[start:end]):
+        if hit:
+            parts += [text[pos:word.start()], '[', word.group(), ']']
+            pos = word.end()
+    parts.append(text[pos:words[end - 1].end()])
+    return ('...' if start else '') + ''.join(parts) + ('...' if end < len(words) else '')
+
+
+def search(text, page=1, page_size=DEFAULT_PAGE_SIZE):
+    """Return (results, has_next) for one page of matches, ranked by bm25 unless the query is too broad."""
+    page = min(max(int(page), 1), MAX_PAGE)
+    page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+    offset = (page - 1) * page_size
+
+    if not fts_available():
+        return search_icontains(text, page, page_size)
+
+    tokens, prefix = query_terms(text)
+    match = build_match_query(text)
+    if not match:
+        return [], False
+
+    # fetch one extra row so we can tell whether there is a next page
+    with connection.cursor() as cursor:
+        cursor.execute(COUNT_SQL, [match, MAX_RANKED_MATCHES + 1])
+        if cursor.fetchone()[0] <= MAX_RANKED_MATCHES:
+            cursor.execute(RANKED_SQL, [match, MAX_RANKED_MATCHES, match, page_size + 1, offset])
+        else:
+            limit = offset + page_size + 1
+            cursor.execute(NEWEST_SQL, [match, limit, match, limit, page_size + 1, offset])
+        rows = cursor.fetchall()
+
+    results = [
+        {'type': kind, 'quiz_id': quiz_id, 'question_id': question_id, 'title': title,
+         'snippet': make_snippet(body, tokens, prefix) if kind == 'question' else title}
+        for kind, quiz_id, question_id, title, body in rows[:page_size]
+    ]
+    return results, len(rows) > page_size
+
+
+def search_icontains(text, page=1, page_size=DEFAULT_PAGE_SIZE):
+    """The old admin-style scan: unranked, quizzes first. Kept as fallback and benchmark baseline."""
+    text = (text or '').strip()
+    if not text:
+        return [], False
+    offset = (page - 1) * page_size
+    limit = offset + page_size + 1
+
+    quizzes = list(
+        Quiz.objects.filter(is_public=True, title__icontains=text)
+        .order_by('id').values('id', 'title')[:limit]
+    )
+    results = [
+        {'type': 'quiz', 'quiz_id': q['id'], 'question_id': None, 'title': q['title'], 'snippet': q['title']}
+        for q in quizzes
+    ]
+    if len(results) < limit:
+        questions = (
+            Question.objects.filter(Q(text__icontains=text), quiz__is_public=True)
+            .order_by('id').values('id', 'quiz_id', 'quiz__title', 'text')[:limit - len(results)]
+        )
+        results += [
+            {'type': 'question', 'quiz_id': q['quiz_id'], 'question_id': q['id'],
+             'title': q['quiz__title'], 'snippet': q['text'][:120]}
+            for q in questions
+        ]
+    page_results = results[offset:offset + page_size]
+    return page_results, len(results) > offset + page_size
+
+
+def rebuild_index():
+    """Rebuild both FTS5 tables from the content tables."""
+    if not fts_available():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO quiz_quiz_fts(quiz_quiz_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO quiz_question_fts(quiz_question_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO quiz_quiz_fts(quiz_quiz_fts) VALUES ('optimize')")
+        cursor.execute("INSERT INTO quiz_question_fts(quiz_question_fts) VALUES ('optimize')")
+    return True
@@ -35,3 +35,8 @@ class DailyChallengeSerializer(serializers.ModelSerializer):
         model = DailyChallenge
         fields = '__all__'
 
+class InstrumentationSwitchSerializer(serializers.Serializer):
+    """Body of a staff POST to /api/metrics/; validate with partial=True so omitted switches stay as they are."""
+    enabled = serializers.BooleanField(required=False)
+    profile = serializers.BooleanField(required=False)
+    reset = serializers.BooleanField(required=False)
@@ -0,0 +1,162 @@
+import bisect
+import hashlib
+from django.conf import settings
+from .protocol import MAX_ANSWER_ID
+
+# Lobby-to-worker affinity.
+# Each lobby id is owned by exactly one ASGI worker, picked from a consistent
+# hash ring so that adding or removing a worker only moves ~1/N of the lobbies.
+# In-process lobby state lives in the owner's LobbyRegistry; any other worker
+# that receives a message for the lobby forwards it to the owner's channel.
+
+DEFAULT_REPLICAS = 64
+MAX_FORWARD_HOPS = 2
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+def worker_channel(worker):
+    """Channel name a worker process listens on (see LobbyWorker in quiz/consumers.py)."""
+    return f'lobby-worker.{worker}'
+
+
+class HashRing:
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self._keys = []
+        self._owners = {}
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return sorted(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, node):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.replicas):
+            key = _hash(f'{node}#{i}')
+            self._owners[key] = node
+            bisect.insort(self._keys, key)
+
+    def remove(self, node):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        for i in range(self.replicas):
+            key = _hash(f'{node}#{i}')
+            del self._owners[key]
+            self._keys.pop(bisect.bisect_left(self._keys, key))
+
+    def owner(self, key):
+        if not self._keys:
+            raise LookupError('hash ring has no workers')
+        index = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._owners[self._keys[index]]
+
+
+class LobbyState:
+    """Game state for one lobby, held only by the lobby's owner worker."""
+
+    def __init__(self, lobby_id, scores=None, answers=0, answer_ids=None):
+        self.lobby_id = str(lobby_id)
+        self.scores = dict(scores or {})
+        self.answers = answers
+        # answer text -> id for the packed protocol; ids never change for the life of the lobby
+        self.answer_ids = dict(answer_ids or {})
+
+    def record_answer(self, user_id, is_correct):
+        user_id = str(user_id)
+        self.answers += 1
+        self.scores[user_id] = self.scores.get(user_id, 0) + (1 if is_correct else 0)
+        return self.scores[user_id]
+
+    def answer_id(self, answer):
+        """Dictionary id for an answer string, or None once the dictionary is full."""
+        answer_id = self.answer_ids.get(answer)
+        if answer_id is None and len(self.answer_ids) <= MAX_ANSWER_ID:
+            answer_id = self.answer_ids[answer] = len(self.answer_ids)
+        return answer_id
+
+    def to_dict(self):
+        return {'lobby_id': self.lobby_id, 'scores': self.scores, 'answers': self.answers,
+                'answer_ids': self.answer_ids}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['lobby_id'], data.get('scores'), data.get('answers', 0), data.get('answer_ids'))
+
+
+class LobbyRegistry:
+    """Per-process view of the ring plus the lobbies this worker owns."""
+
+    def __init__(self, worker, workers, replicas=DEFAULT_REPLICAS):
+        self.worker = worker
+        self.ring = HashRing(workers, replicas=replicas)
+        self.lobbies = {}
+
+    def owner(self, lobby_id):
+        return self.ring.owner(lobby_id)
+
+    def owns(self, lobby_id):
+        return self.owner(lobby_id) == self.worker
+
+    def state(self, lobby_id):
+        lobby_id = str(lobby_id)
+        state = self.lobbies.get(lobby_id)
+        if state is None:
+            state = self.lobbies[lobby_id] = LobbyState(lobby_id)
+        return state
+
+    def record_answer(self, lobby_id, user_id, is_correct):
+        return self.state(lobby_id).record_answer(user_id, is_correct)
+
+    def rebalance(self, workers):
+        """Switch to a new worker set; return {new_owner: [state dicts]} for lobbies that moved away."""
+        for node in set(self.ring.nodes) - set(workers):
+            self.ring.remove(node)
+        for node in workers:
+            self.ring.add(node)
+
+        moved = {}
+        for lobby_id in list(self.lobbies):
+            owner = self.owner(lobby_id) if len(self.ring) else None
+            if owner != self.worker:
+                moved.setdefault(owner, []).append(self.lobbies.pop(lobby_id).to_dict())
+        return moved
+
+    def adopt(self, states):
+        for data in states:
+            state = LobbyState.from_dict(data)
+            existing = self.lobbies.get(state.lobby_id)
+            if existing is not None:
+                # answers that raced the handoff landed here first; keep both
+                for user_id, score in existing.scores.items():
+                    state.scores[user_id] = state.scores.get(user_id, 0) + score
+                state.answers += existing.answers
+                for answer in existing.answer_ids:
+                    state.answer_id(answer)
+            self.lobbies[state.lobby_id] = state
+
+
+_registry = None
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        workers = getattr(settings, 'LOBBY_WORKERS', ['default'])
+        worker = getattr(settings, 'LOBBY_WORKER_NAME', 'default')
+        _registry = LobbyRegistry(worker, workers)
+    return _registry
@@ -0,0 +1,37 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from . import bundles, caching
+from .models import Quiz, Question, LeaderboardEntry, DailyChallenge
+
+
+def invalidate_on_commit(invalidate, *args):
+    # dropped any earlier, a concurrent request could refill the entry from the old row before the commit
+    transaction.on_commit(partial(invalidate, *args))
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    invalidate_on_commit(caching.invalidate_quiz, instance.pk)
+    bundles.schedule_publish(instance.pk)
+    # today's challenge embeds the quiz payload
+    invalidate_on_commit(caching.invalidate_daily, timezone.localdate())
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate_on_commit(caching.invalidate_quiz, instance.quiz_id)
+    bundles.schedule_publish(instance.quiz_id)
+    invalidate_on_commit(caching.invalidate_daily, timezone.localdate())
+
+
+@receiver([post_save, post_delete], sender=LeaderboardEntry)
+def leaderboard_changed(sender, instance, **kwargs):
+    invalidate_on_commit(caching.invalidate_leaderboard, instance.quiz_id)
+
+
+@receiver([post_save, post_delete], sender=DailyChallenge)
+def daily_challenge_changed(sender, instance, **kwargs):
+    invalidate_on_commit(caching.invalidate_daily, instance.date)
@@ -1,9 +1,41 @@
-from datetime import date
-from .models import DailyChallenge, Quiz
+from datetime import date, timedelta
+from django.conf import settings
+from django.utils import timezone
+from . import answer_log, bundles
+from .jobs import job
+from .models import DailyChallenge, Job, Quiz
 
+# Jobs run by `manage.py run_jobs` (see quiz/jobs.py). Each is a plain function,
+# so it can still be called directly, e.g. from the shell.
+
+
+@job()
 def create_daily_challenge():
     today = date.today()
     if not DailyChallenge.objects.filter(date=today).exists():
         quiz = Quiz.objects.order_by('?').first()
         if quiz:
             DailyChallenge.objects.create(quiz=quiz, date=today)
+
+
+@job(max_attempts=5, retry_delay=10)
+def publish_quiz_bundle(quiz_id):
+    bundles.publish_quiz(quiz_id)
+
+
+@job(max_attempts=3, retry_delay=30)
+def publish_all_bundles():
+    bundles.publish_all(prune=False)
+
+
+@job(max_attempts=5, retry_delay=5, max_retry_delay=60)
+def project_answer_log(batch_size=1000):
+    if settings.ANSWER_LOG_ENABLED:
+        answer_log.project(batch_size)
+
+
+@job(max_attempts=1)
+def prune_jobs(days=7):
+    """Delete finished jobs older than `days`; failed ones are kept for inspection."""
+    cutoff = timezone.now() - timedelta(days=days)
+    Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()
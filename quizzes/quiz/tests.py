@@ -0,0 +1,945 @@
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.handlers import StaticFilesHandler
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import re_path
+from django.utils import timezone
+from . import (answer_log, answers, bundles, caching, instrumentation, jobs, lifespan, matchmaking, metrics, pools,
+               projections, search, views)
+from .backpressure import Outbox, TokenBucket
+from .consumers import LobbyConsumer, LobbyWorker, MatchmakingConsumer, handle_answer
+from .models import AttemptAnswer, Job, JobSchedule, LeaderboardEntry, Question, Quiz, QuizAttempt
+from .routers import ReplicaRouter, bind_current_routing, read_from_replica
+from .protocol import (SUBPROTOCOL, ProtocolError, build_score_event, decode_answer, decode_server_frame,
+                       encode_answer, encode_define_answer, encode_score_update)
+from .serializers import LeaderboardEntrySerializer, QuizSerializer
+from .sharding import HashRing, LobbyRegistry, worker_channel
+
+# a private cache per test run, never the shared one from settings that running workers use
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def lobby_owned_by(registry, worker):
+    return next(str(i) for i in range(1000) if registry.owner(str(i)) == worker)
+
+
+class HashRingTests(SimpleTestCase):
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        ring = HashRing(['w0', 'w1', 'w2', 'w3'])
+        before = {key: ring.owner(key) for key in range(2000)}
+        ring.add('w4')
+        moved = {key for key in before if ring.owner(key) != before[key]}
+        self.assertTrue(all(ring.owner(key) == 'w4' for key in moved))
+        self.assertLess(len(moved), 2000 * 0.35)
+
+    def test_removing_a_node_restores_previous_owners(self):
+        ring = HashRing(['w0', 'w1', 'w2'])
+        before = {key: ring.owner(key) for key in range(500)}
+        ring.add('w3')
+        ring.remove('w3')
+        self.assertEqual({key: ring.owner(key) for key in range(500)}, before)
+
+    def test_empty_ring(self):
+        with self.assertRaises(LookupError):
+            HashRing().owner('1')
+
+
+class LobbyRegistryTests(SimpleTestCase):
+    def test_rebalance_returns_states_that_moved_away(self):
+        registry = LobbyRegistry('w0', ['w0'])
+        for lobby_id in range(200):
+            registry.record_answer(lobby_id, 'u1', True)
+        moved = registry.rebalance(['w0', 'w1'])
+        self.assertEqual(set(moved), {'w1'})
+        self.assertTrue(all(registry.owns(lobby_id) for lobby_id in registry.lobbies))
+        self.assertEqual(len(registry.lobbies) + len(moved['w1']), 200)
+        self.assertEqual(moved['w1'][0]['scores'], {'u1': 1})
+
+    def test_leaving_worker_hands_off_everything(self):
+        registry = LobbyRegistry('w0', ['w0', 'w1'])
+        registry.record_answer(lobby_owned_by(registry, 'w0'), 'u1', True)
+        moved = registry.rebalance(['w1'])
+        self.assertEqual(registry.lobbies, {})
+        self.assertEqual(len(moved['w1']), 1)
+
+    def test_adopt_keeps_answers_that_raced_the_handoff(self):
+        registry = LobbyRegistry('w1', ['w1'])
+        registry.record_answer('7', 'u1', True)
+        registry.state('7').answer_id('B')
+        registry.adopt([{'lobby_id': '7', 'scores': {'u1': 2, 'u2': 1}, 'answers': 3, 'answer_ids': {'A': 0}}])
+        state = registry.state('7')
+        self.assertEqual(state.scores, {'u1': 3, 'u2': 1})
+        self.assertEqual(state.answers, 4)
+        self.assertEqual(state.answer_ids, {'A': 0, 'B': 1})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LobbyWorkerTests(TestCase):
+    """Two workers sharing an in-memory channel layer, as two processes would share Redis."""
+
+    def setUp(self):
+        self.layer = InMemoryChannelLayer()
+        self.registries = {name: LobbyRegistry(name, ['w0', 'w1']) for name in ('w0', 'w1')}
+        self.lobby_id = lobby_owned_by(self.registries['w0'], 'w1')
+
+    async def run_until(self, worker, condition):
+        task = asyncio.get_running_loop().create_task(LobbyWorker(self.layer, self.registries[worker]).run())
+        try:
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.005)
+            self.fail('condition not met')
+        finally:
+            task.cancel()
+
+    async def test_answer_is_scored_on_the_owner(self):
+        listener = await self.layer.new_channel()
+        await self.layer.group_add(f'lobby_{self.lobby_id}', listener)
+        data = {'type': 'answer', 'user_id': 1, 'question_id': 5, 'answer': 'A'}
+        await handle_answer(self.layer, self.lobby_id, data, is_correct=True, registry=self.registries['w0'])
+
+        self.assertEqual(self.registries['w0'].lobbies, {})
+        owner = self.registries['w1']
+        await self.run_until('w1', lambda: self.lobby_id in owner.lobbies)
+        self.assertEqual(owner.state(self.lobby_id).scores, {'1': 1})
+        event = await self.layer.receive(listener)
+        self.assertEqual((event['type'], event['score']), ('score_update', 1))
+
+    async def test_membership_change_hands_lobbies_to_the_new_owner(self):
+        leaving, staying = self.registries['w1'], self.registries['w0']
+        leaving.record_answer(self.lobby_id, 'u1', True)
+        await LobbyWorker(self.layer, leaving).lobby_membership({'workers': ['w0']})
+        self.assertEqual(leaving.lobbies, {})
+        staying.rebalance(['w0'])
+        await self.run_until('w0', lambda: self.lobby_id in staying.lobbies)
+        self.assertEqual(staying.state(self.lobby_id).scores, {'u1': 1})
+
+    async def test_answer_is_saved_where_it_arrives(self):
+        # the owner's listener is not running: the score update waits on its channel, the answer does not
+        quiz_id, question_id = await self.make_attempt()
+        data = {'type': 'answer', 'user_id': self.user_id, 'quiz_id': quiz_id, 'question_id': question_id,
+                'answer': 'Paris'}
+        await handle_answer(self.layer, self.lobby_id, data, registry=self.registries['w0'])
+        saved = await AttemptAnswer.objects.filter(question_id=question_id).values_list('is_correct').aget()
+        self.assertEqual(saved, (True,))
+        message = await self.layer.receive(worker_channel('w1'))
+        self.assertEqual((message['type'], message['is_correct']), ('lobby.answer', True))
+
+    async def make_attempt(self):
+        user = await get_user_model().objects.acreate(username='player')
+        quiz = await Quiz.objects.acreate(title='Capitals', creator=user)
+        question = await Question.objects.acreate(quiz=quiz, text='Capital of France?', question_type='MC',
+                                                  correct_answer='Paris')
+        await QuizAttempt.objects.acreate(user=user, quiz=quiz)
+        self.user_id = user.pk
+        return quiz.pk, question.pk
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.bucket = TokenBucket(rate=2, burst=3, clock=lambda: self.now)
+
+    def test_burst_then_refill_at_rate(self):
+        self.assertEqual([self.bucket.allow() for _ in range(4)], [True, True, True, False])
+        self.now += 0.5
+        self.assertEqual([self.bucket.allow() for _ in range(2)], [True, False])
+
+    def test_refill_is_capped_at_burst(self):
+        for _ in range(3):
+            self.bucket.allow()
+        self.now += 60
+        self.assertEqual(sum(self.bucket.allow() for _ in range(10)), 3)
+
+
+def score(user_id, value):
+    return {'type': 'score_update', 'user_id': user_id, 'score': value}
+
+
+class OutboxTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+        self.outbox = Outbox(maxsize=3, lobby_id='7')
+
+    async def drain(self):
+        return [await self.outbox.pop() for _ in range(len(self.outbox))]
+
+    async def test_newer_score_replaces_queued_one_in_place(self):
+        self.outbox.push(score(1, 1))
+        self.outbox.push({'type': 'chat', 'text': 'hi'})
+        self.outbox.push(score(1, 2))
+        self.assertEqual(await self.drain(), [score(1, 2), {'type': 'chat', 'text': 'hi'}])
+        self.assertEqual(metrics.lobby_counters['7'], {'merged': 1})
+
+    async def test_full_outbox_drops_the_oldest(self):
+        for user_id in range(5):
+            self.outbox.push(score(user_id, 1))
+        self.assertEqual([event['user_id'] for event in await self.drain()], [2, 3, 4])
+        self.assertEqual(metrics.lobby_counters['7'], {'dropped': 2})
+
+    async def test_pop_waits_for_a_push(self):
+        waiting = asyncio.ensure_future(self.outbox.pop())
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        self.outbox.push(score(1, 1))
+        self.assertEqual(await asyncio.wait_for(waiting, 1), score(1, 1))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   LOBBY_RATE_LIMIT=0.001, LOBBY_RATE_BURST=2, LOBBY_MAX_MESSAGE_BYTES=100)
+class LobbyConsumerLimitTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+
+    async def connect(self):
+        app = URLRouter([re_path(r'ws/lobby/(?P<lobby_id>\w+)/$', LobbyConsumer.as_asgi())])
+        communicator = WebsocketCommunicator(app, '/ws/lobby/9/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_frames_beyond_the_burst_are_rate_limited(self):
+        communicator = await self.connect()
+        for _ in range(5):
+            await communicator.send_to(text_data='{"type": "ping"}')
+        await communicator.receive_nothing()
+        self.assertEqual(metrics.lobby_counters['9']['rate_limited'], 3)
+        await communicator.disconnect()
+
+    async def test_oversized_frame_closes_the_socket(self):
+        communicator = await self.connect()
+        await communicator.send_to(text_data='x' * 101)
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 1009})
+        self.assertEqual(metrics.lobby_counters['9'], {'oversized': 1})
+
+    async def test_undecodable_frame_is_counted_and_ignored(self):
+        communicator = await self.connect()
+        await communicator.send_to(text_data='not json')
+        await communicator.receive_nothing()
+        self.assertEqual(metrics.lobby_counters['9'], {'invalid': 1})
+        await communicator.disconnect()
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_answer_round_trip(self):
+        frame = encode_answer(7, 3, 99, 'Zürich')
+        self.assertEqual(decode_answer(frame), {'type': 'answer', 'user_id': 7, 'quiz_id': 3, 'question_id': 99,
+                                                'answer': 'Zürich'})
+
+    def test_server_frames_round_trip(self):
+        self.assertEqual(decode_server_frame(encode_score_update(7, 99, 12, 65535)),
+                         {'type': 'score_update', 'user_id': 7, 'question_id': 99, 'score': 12, 'answer_id': 65535})
+        self.assertEqual(decode_server_frame(encode_define_answer(4, 'Ålesund')),
+                         {'type': 'define_answer', 'answer_id': 4, 'answer': 'Ålesund'})
+
+    def test_malformed_frames_are_rejected(self):
+        for frame in (b'', encode_answer(1, 2, 3, 'A')[:8], encode_score_update(1, 2, 3, 4),
+                      encode_answer(1, 2, 3, '') + b'\xff'):
+            with self.assertRaises(ProtocolError):
+                decode_answer(frame)
+        with self.assertRaises(ProtocolError):
+            decode_server_frame(encode_answer(1, 2, 3, 'A'))
+
+    def test_score_event_carries_both_formats(self):
+        event = build_score_event(7, 99, 'Paris', 12, answer_id=4)
+        self.assertEqual(decode_server_frame(event['packed'])['answer_id'], 4)
+        self.assertEqual(json.loads(event['text']), {'type': 'score_update', 'user_id': 7, 'question_id': 99,
+                                                     'answer': 'Paris', 'score': 12})
+
+    def test_score_event_falls_back_to_text_when_values_do_not_fit(self):
+        self.assertIsNone(build_score_event(2 ** 32, 1, 'A', 1, answer_id=0)['packed'])
+        self.assertIsNone(build_score_event(1, 1, 'A', 1, answer_id=None)['packed'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class PackedLobbyTests(SimpleTestCase):
+    async def test_answer_strings_are_defined_once_per_connection(self):
+        app = URLRouter([re_path(r'ws/lobby/(?P<lobby_id>\w+)/$', LobbyConsumer.as_asgi())])
+        communicator = WebsocketCommunicator(app, '/ws/lobby/5/', subprotocols=[SUBPROTOCOL])
+        connected, subprotocol = await communicator.connect()
+        self.assertEqual((connected, subprotocol), (True, SUBPROTOCOL))
+        layer = get_channel_layer()
+        for score in (1, 2):
+            await layer.group_send('lobby_5', build_score_event(7, 99, 'Paris', score, answer_id=0))
+        frames = [decode_server_frame(await communicator.receive_from()) for _ in range(3)]
+        self.assertEqual([frame['type'] for frame in frames], ['define_answer', 'score_update', 'score_update'])
+        self.assertEqual([frames[1]['score'], frames[2]['score']], [1, 2])
+        await communicator.disconnect()
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def test_reads_stay_on_primary_outside_wrapped_views(self):
+        self.assertEqual(self.router.db_for_read(Quiz), 'default')
+
+    def test_first_write_pins_the_rest_of_the_request(self):
+        @read_from_replica
+        def view():
+            before = self.router.db_for_read(Quiz)
+            self.assertEqual(self.router.db_for_write(Quiz), 'default')
+            return before, self.router.db_for_read(Quiz), self.router.db_for_read(Question)
+        self.assertEqual(view(), ('replica1', 'default', 'default'))
+        # the pin ends with the request
+        self.assertEqual(view()[0], 'replica1')
+
+    def test_auth_reads_stay_on_primary(self):
+        @read_from_replica
+        def view():
+            return self.router.db_for_read(get_user_model())
+        self.assertEqual(view(), 'default')
+
+    def test_streamed_body_keeps_the_request_routing(self):
+        @read_from_replica
+        def view():
+            self.router.db_for_write(Quiz)
+            return bind_current_routing(self.router.db_for_read(Quiz) for _ in range(2))
+        self.assertEqual(list(view()), ['default', 'default'])
+
+        @read_from_replica
+        def unpinned():
+            return bind_current_routing(self.router.db_for_read(Quiz) for _ in range(2))
+        self.assertEqual(list(unpinned()), ['replica1', 'replica1'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = get_user_model().objects.create(username='author')
+        self.quiz = Quiz.objects.create(title='Capitals', creator=user, is_public=True)
+        self.question = Question.objects.create(quiz=self.quiz, text='Capital of France?', question_type='MC',
+                                                correct_answer=' Paris ')
+
+    def test_saving_a_question_drops_the_answer_key(self):
+        self.assertEqual(caching.answer_key(self.quiz.pk), {self.question.pk: 'paris'})
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Question.objects.create(quiz=self.quiz, text='Capital of Spain?', question_type='MC',
+                                            correct_answer='Madrid')
+        self.assertEqual(caching.answer_key(self.quiz.pk)[added.pk], 'madrid')
+
+    def test_entries_are_dropped_after_the_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.correct_answer = 'Lyon'
+            self.question.save()
+            # a concurrent request still sees the committed row and refills the key before the commit
+            cache.set(caching.answers_key(self.quiz.pk), {self.question.pk: 'paris'})
+        self.assertEqual(caching.answer_key(self.quiz.pk), {self.question.pk: 'lyon'})
+
+    def test_a_rolled_back_change_keeps_the_entries(self):
+        key = caching.answer_key(self.quiz.pk)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.question.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(cache.get(caching.answers_key(self.quiz.pk)), key)
+
+    def test_correct_answer_falls_back_to_the_database(self):
+        cache.set(caching.answers_key(self.quiz.pk), {})
+        self.assertEqual(caching.correct_answer(self.quiz.pk, self.question.pk), 'paris')
+        with self.assertRaises(Question.DoesNotExist):
+            caching.correct_answer(self.quiz.pk + 1, self.question.pk)
+
+    @override_settings(DATABASE_REPLICAS=['not-a-database'])
+    def test_entries_are_built_from_the_primary(self):
+        # a read routed to the (unconfigured) replica alias would raise ConnectionDoesNotExist
+        @read_from_replica
+        def view():
+            return caching.quiz_payload(self.quiz.pk), caching.answer_key(self.quiz.pk)
+        payload, key = view()
+        self.assertEqual([q['id'] for q in payload['questions']], [self.question.pk])
+        self.assertEqual(key, {self.question.pk: 'paris'})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BundleTests(TransactionTestCase):
+    def setUp(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        overrides = self.settings(STATIC_ROOT=static_root, QUIZ_BUNDLES_AUTO_PUBLISH=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = get_user_model().objects.create(username='author')
+
+    def make_quiz(self, title):
+        return Quiz.objects.create(title=title, creator=self.user, is_public=True)
+
+    def test_first_publish_queues_a_full_publish(self):
+        quiz = self.make_quiz('Capitals')
+        bundles.publish_quiz(quiz.pk)
+        self.assertIsNone(bundles.read_catalogue())
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['publish_all_bundles'])
+
+    def test_concurrent_publishes_keep_every_entry(self):
+        bundles.publish_all()
+        quizzes = [self.make_quiz(f'Quiz {i}') for i in range(8)]
+
+        def publish(quiz_id):
+            try:
+                bundles.publish_quiz(quiz_id)
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=publish, args=(quiz.pk,)) for quiz in quizzes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(set(bundles.read_catalogue()), {quiz.pk for quiz in quizzes})
+
+    def test_hidden_quiz_leaves_the_catalogue(self):
+        quiz = self.make_quiz('Capitals')
+        bundles.publish_all()
+        Quiz.objects.filter(pk=quiz.pk).update(is_public=False)
+        bundles.publish_quiz(quiz.pk)
+        self.assertEqual(bundles.read_catalogue(), {})
+        self.assertEqual(list(bundles.bundle_dir().glob('quiz-*.json')), [])
+
+    def test_quiz_list_is_served_from_the_catalogue(self):
+        quiz = self.make_quiz('Capitals')
+        bundles.publish_all()
+        Quiz.objects.filter(pk=quiz.pk).update(title='Renamed but not yet published')
+        with self.settings(QUIZ_BUNDLES_AUTO_PUBLISH=True):
+            response = self.client.get('/quizzes/')
+        self.assertContains(response, 'Capitals')
+
+    def test_development_bundles_are_served_outside_static_url(self):
+        quiz = self.make_quiz('Capitals')
+        with self.settings(DEBUG=True):
+            url = bundles.publish_all()[0][quiz.pk]['bundle']
+        # runserver's static files handler would answer (with a 404) anything under STATIC_URL
+        self.assertFalse(StaticFilesHandler(WSGIHandler())._should_handle(url))
+        response = views.quiz_bundle(RequestFactory().get(url), url.rsplit('/', 1)[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], bundles.IMMUTABLE_CACHE_CONTROL)
+        # switching DEBUG off changes the URLs, not which bundles are current
+        self.assertEqual(bundles.publish_all()[1], 0)
+
+
+def keep_instrumentation_state(test):
+    """Undo a test's instrumentation switches, metrics and profiles."""
+    test.addCleanup(instrumentation.state.update, dict(instrumentation.state))
+    test.addCleanup(instrumentation.profiler.stop)
+    test.addCleanup(instrumentation.profiler.clear)
+    test.addCleanup(metrics.reset)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        keep_instrumentation_state(self)
+
+    def switch(self, **data):
+        return self.client.post('/api/metrics/', data)
+
+    def test_metrics_are_for_staff_only(self):
+        self.assertEqual(self.client.get('/api/metrics/?profile=1').status_code, 403)
+        self.assertEqual(self.client.post('/api/metrics/', {'enabled': '1'}).status_code, 403)
+        staff = get_user_model().objects.create(username='admin', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/api/metrics/?profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('slowest_messages', response.json())
+
+    def test_switches_are_parsed_strictly(self):
+        self.client.force_login(get_user_model().objects.create(username='admin', is_staff=True))
+        response = self.switch(enabled='true', profile='1')
+        self.assertEqual(response.json()['instrumentation'], {'enabled': True, 'profile': True})
+        # an omitted switch is left alone
+        self.assertEqual(self.switch(profile='false').json()['instrumentation'], {'enabled': True, 'profile': False})
+        for off in ('0', 'false'):
+            self.switch(enabled='true')
+            self.assertEqual(self.switch(enabled=off).json()['instrumentation']['enabled'], False)
+        for value in ('maybe', '2', 'null'):
+            self.assertEqual(self.switch(enabled=value).status_code, 400)
+        self.assertEqual(instrumentation.state, {'enabled': False, 'profile': False})
+
+    def test_reset_clears_metrics_and_profiles(self):
+        self.client.force_login(get_user_model().objects.create(username='admin', is_staff=True))
+        metrics.observe('ws_delivery_seconds', 0.01)
+        instrumentation.profiler.record(0.0, 0.5, {'type': 'answer'})
+        self.assertEqual(self.switch(reset='no').status_code, 200)
+        self.assertIn('ws_delivery_seconds', metrics.snapshot()['histograms'])
+        self.switch(reset='yes')
+        self.assertEqual(metrics.snapshot()['histograms'], {})
+        self.assertEqual(instrumentation.profiler.dump(), [])
+
+
+class InstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        keep_instrumentation_state(self)
+        metrics.reset()
+
+    def test_timed_observes_each_stage_only_when_enabled(self):
+        instrumentation.set_enabled(False)
+        with instrumentation.timed('receive'):
+            pass
+        self.assertEqual(metrics.snapshot()['histograms'], {})
+        instrumentation.set_enabled(True)
+        with instrumentation.timed('receive') as info:
+            with instrumentation.timed('handle_message'):
+                info['type'] = 'answer'
+        histograms = metrics.snapshot()['histograms']
+        self.assertEqual(sorted(histograms), ['ws_message_seconds{stage=handle_message}',
+                                              'ws_message_seconds{stage=receive}'])
+        self.assertEqual(histograms['ws_message_seconds{stage=receive}']['count'], 1)
+
+    def test_profiled_receives_are_recorded(self):
+        instrumentation.set_enabled(True, profile=True)
+        with mock.patch.object(instrumentation.profiler, 'start'):
+            with instrumentation.timed('receive', lobby_id='7') as info:
+                info['type'] = 'answer'
+            with instrumentation.timed('handle_message'):
+                pass
+        [entry] = instrumentation.profiler.dump()
+        self.assertEqual((entry['lobby_id'], entry['type']), ('7', 'answer'))
+
+    def test_delivered_observes_stamped_events(self):
+        instrumentation.set_enabled(False)
+        instrumentation.delivered(instrumentation.stamp({'type': 'score_update'}))
+        self.assertEqual(metrics.snapshot()['histograms'], {})
+        instrumentation.set_enabled(True)
+        event = instrumentation.stamp({'type': 'score_update'})
+        instrumentation.delivered(event)
+        instrumentation.delivered({'type': 'score_update'})  # sent while instrumentation was off
+        self.assertEqual(metrics.snapshot()['histograms']['ws_delivery_seconds']['count'], 1)
+
+    def test_profiler_keeps_the_slowest_messages_with_their_stacks(self):
+        profiler = instrumentation.SlowMessageProfiler(keep=2)
+        profiler.samples.extend([(1.0, 'consumers.py:receive'), (1.1, 'caching.py:answer_key'),
+                                 (5.0, 'consumers.py:receive')])
+        profiler.record(1.0, 0.2, {'type': 'answer'})
+        profiler.record(3.0, 0.1, {'type': 'ping'})
+        profiler.record(5.0, 0.3, {'type': 'answer'})
+        profiler.record(7.0, 0.05, {'type': 'ping'})  # faster than everything kept
+        self.assertEqual([(entry['seconds'], entry['stacks']) for entry in profiler.dump()], [
+            (0.3, {'consumers.py:receive': 1}),
+            (0.2, {'consumers.py:receive': 1, 'caching.py:answer_key': 1}),
+        ])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AnswerLogTests(TestCase):
+    def setUp(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        overrides = self.settings(ANSWER_LOG_DIR=log_dir, ANSWER_LOG_ENABLED=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        index = mock.patch.object(answer_log, '_pending', answer_log.PendingIndex())
+        index.start()
+        self.addCleanup(index.stop)
+
+        self.log = answer_log.AnswerLog(Path(log_dir) / 'w1', segment_bytes=1024, fsync=False)
+        self.addCleanup(self.log.file.close)
+        user = get_user_model().objects.create(username='player')
+        quiz = Quiz.objects.create(title='Capitals', creator=user)
+        self.question_ids = [
+            Question.objects.create(quiz=quiz, text=f'Question {i}', question_type='MC', correct_answer='a').pk
+            for i in range(4)
+        ]
+        self.attempts = [QuizAttempt.objects.create(user=user, quiz=quiz) for _ in range(3)]
+
+    def append(self, attempt, question_id, is_correct):
+        self.log.append({'attempt_id': attempt.pk, 'question_id': question_id, 'selected_answer': 'a',
+                         'is_correct': is_correct, 'ts': 0})
+
+    def append_all(self):
+        expected = {attempt.pk: [] for attempt in self.attempts}
+        for i, question_id in enumerate(self.question_ids):
+            for attempt in self.attempts:
+                self.append(attempt, question_id, i % 2 == 0)
+                expected[attempt.pk].append((question_id, i % 2 == 0))
+        return expected
+
+    def test_projection_matches_the_log(self):
+        expected = self.append_all()
+        self.assertGreater(len(answer_log.list_segments(self.log.directory)), 1)
+
+        # a crash in the middle of a batch, after the answers are inserted, leaves nothing behind
+        records = answer_log.read_records(self.log.directory, 0, limit=5)
+        crash = mock.patch.object(QuizAttempt.objects, 'bulk_update', side_effect=RuntimeError('crashed'))
+        with crash, self.assertRaises(RuntimeError):
+            answer_log.apply_batch('w1', records)
+        self.assertFalse(AttemptAnswer.objects.exists())
+        self.assertEqual(answer_log.checkpoints(), {})
+
+        self.assertEqual(answer_log.project(batch_size=5), 12)
+        self.assertEqual(answer_log.project(batch_size=5), 0)
+        for attempt in self.attempts:
+            attempt.refresh_from_db()
+            rows = list(attempt.answers.order_by('id').values_list('question_id', 'is_correct'))
+            self.assertEqual(rows, expected[attempt.pk])
+            self.assertEqual(attempt.score, 2)
+        self.assertEqual(len(answer_log.list_segments(self.log.directory)), 1)
+
+    def test_pending_answers_are_merged_while_the_log_grows(self):
+        attempt = self.attempts[0]
+        self.append(attempt, self.question_ids[0], True)
+        self.assertEqual(answers.attempt_answers(attempt.pk), [(self.question_ids[0], True)])
+        answer_log.project()
+        self.append(attempt, self.question_ids[1], False)
+        self.assertEqual(answers.attempt_answers(attempt.pk),
+                         [(self.question_ids[0], True), (self.question_ids[1], False)])
+        self.assertEqual(answers.attempt_score(attempt.pk), 1)
+
+    def test_projection_between_checkpoint_and_rows_counts_once(self):
+        expected = self.append_all()
+        attempt = self.attempts[0]
+        read_pending = answer_log.pending_answers
+
+        def pending_then_project(attempt_id, done):
+            pending = read_pending(attempt_id, done)
+            answer_log.project()
+            return pending
+        with mock.patch.object(answer_log, 'pending_answers', pending_then_project):
+            self.assertEqual(answers.attempt_answers(attempt.pk), expected[attempt.pk])
+        self.assertEqual(answers.attempt_score(attempt.pk), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProjectionTests(TestCase):
+    def test_rows_match_the_serializers(self):
+        user = get_user_model().objects.create(username='player')
+        quiz = Quiz.objects.create(title='Capitals', creator=user, pool_size=1)
+        Question.objects.create(quiz=quiz, text='Capital of France?', question_type='MC', correct_answer='Paris',
+                                option_a='Paris', option_b='Lyon')
+        LeaderboardEntry.objects.create(quiz=quiz, user=user, score=3, time_taken_seconds=12)
+
+        self.assertEqual(projections.quiz_payloads([quiz.pk])[quiz.pk], dict(QuizSerializer(quiz).data))
+        self.assertEqual(
+            list(projections.leaderboard_rows(quiz.pk)),
+            [dict(row) for row in LeaderboardEntrySerializer(LeaderboardEntry.objects.all(), many=True).data],
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class JobTests(TestCase):
+    def claim_job(self, name='prune_jobs'):
+        job = jobs.enqueue(name)
+        self.assertEqual(jobs.claim('w1', 1), [job.pk])
+        return job
+
+    def test_heartbeat_keeps_a_long_job_running(self):
+        job = self.claim_job('create_daily_challenge')
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.heartbeat('w1', [job.pk]), 1)
+        self.assertEqual(jobs.requeue_expired(lease=60), 0)
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(jobs.requeue_expired(lease=60), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.QUEUED)
+
+    def test_heartbeat_ignores_jobs_of_other_workers(self):
+        job = self.claim_job()
+        self.assertEqual(jobs.heartbeat('w2', [job.pk]), 0)
+
+    def test_failed_job_is_retried_later_then_marked_failed(self):
+        registry = mock.patch.dict(jobs.registry)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+        @jobs.job(name='flaky', max_attempts=2, retry_delay=60)
+        def flaky():
+            raise ValueError('upstream down')
+
+        job = self.claim_job('flaky')
+        self.assertEqual(jobs.execute(job.pk)[1], 'retry')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=29))
+        self.assertIn('upstream down', job.last_error)
+        self.assertEqual(jobs.claim('w1', 1), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(jobs.claim('w1', 1), [job.pk])
+        self.assertEqual(jobs.execute(job.pk)[1], 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_queued_jobs_with_the_same_dedupe_key_collapse(self):
+        first = jobs.enqueue('publish_all_bundles', dedupe_key='publish-all-bundles')
+        self.assertEqual(jobs.enqueue('publish_all_bundles', dedupe_key='publish-all-bundles').pk, first.pk)
+        self.assertEqual(Job.objects.count(), 1)
+        # once the first is running, a later change needs a run of its own
+        self.assertEqual(jobs.claim('w1', 1), [first.pk])
+        second = jobs.enqueue('publish_all_bundles', dedupe_key='publish-all-bundles')
+        self.assertNotEqual(second.pk, first.pk)
+        self.assertEqual(jobs.enqueue('publish_all_bundles', dedupe_key='publish-all-bundles').pk, second.pk)
+
+    def test_due_schedule_is_queued_once(self):
+        schedules = {'prune': {'job': 'prune_jobs', 'every': 3600}}
+        self.assertEqual(jobs.queue_due_schedules(schedules), ['prune'])
+        self.assertEqual(jobs.queue_due_schedules(schedules), [])
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['prune_jobs'])
+        # due again: still queued under the schedule's dedupe key, so no second job
+        JobSchedule.objects.filter(name='prune').update(next_run_at=timezone.now())
+        self.assertEqual(jobs.queue_due_schedules(schedules), ['prune'])
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_job_timings_are_served_with_the_metrics(self):
+        job = self.claim_job()
+        jobs.execute(job.pk)
+        self.client.force_login(get_user_model().objects.create(username='admin', is_staff=True))
+        stats = self.client.get('/api/metrics/').json()['jobs']
+        self.assertEqual(stats['prune_jobs']['done'], 1)
+        self.assertIn('avg_seconds', stats['prune_jobs'])
+
+
+class MatchmakingConsumerTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create(username='author')
+        self.public = Quiz.objects.create(title='Capitals', creator=user, is_public=True)
+        self.private = Quiz.objects.create(title='Drafts', creator=user, is_public=False)
+
+    async def join(self, quiz_id):
+        consumer = MatchmakingConsumer()
+        consumer.channel_layer, consumer.channel_name = None, 'player'
+        consumer.user_id, consumer.bucket = None, None
+        sent = []
+        with mock.patch.object(consumer, 'send', side_effect=lambda text_data: sent.append(json.loads(text_data))), \
+                mock.patch.object(matchmaking, 'join') as queue:
+            await consumer.join({'type': 'join', 'quiz_id': quiz_id, 'size': 2})
+        return sent, queue
+
+    async def test_only_public_quizzes_can_be_queued_for(self):
+        for quiz_id in (self.private.pk, self.public.pk + 100):
+            sent, queue = await self.join(quiz_id)
+            self.assertEqual(sent, [{'type': 'error', 'detail': 'no such public quiz'}])
+            queue.assert_not_called()
+        sent, queue = await self.join(self.public.pk)
+        self.assertEqual(sent, [{'type': 'queued', 'quiz_id': self.public.pk, 'size': 2}])
+        queue.assert_called_once()
+
+
+class MatchmakerTests(SimpleTestCase):
+    def setUp(self):
+        self.matchmaker = matchmaking.Matchmaker((2, 4), min_players=2, max_wait=10, fill_seconds=30)
+
+    def join(self, channel, size=4, at=0):
+        return self.matchmaker.join(channel, 1, size, joined_at=at)
+
+    def channels(self, match):
+        return [ticket.channel for ticket in match.tickets]
+
+    def test_full_groups_are_matched_in_join_order(self):
+        for channel in ('a', 'b', 'c'):
+            self.join(channel, size=2)
+        [match] = self.matchmaker.due(now=1)
+        self.assertEqual((self.channels(match), match.lobby_id), (['a', 'b'], None))
+        self.assertEqual(len(self.matchmaker), 1)
+
+    def test_smaller_group_starts_after_max_wait(self):
+        for channel in ('a', 'b', 'c'):
+            self.join(channel)
+        self.assertEqual(self.matchmaker.due(now=9), [])
+        [match] = self.matchmaker.due(now=10)
+        self.assertEqual((self.channels(match), match.free_seats), (['a', 'b', 'c'], 1))
+
+    def test_lone_player_keeps_waiting(self):
+        self.join('a')
+        self.assertEqual(self.matchmaker.due(now=100), [])
+        self.assertEqual(len(self.matchmaker), 1)
+
+    def test_later_joiners_fill_free_seats(self):
+        for channel in ('a', 'b', 'c'):
+            self.join(channel)
+        [match] = self.matchmaker.due(now=10)
+        match.lobby_id, match.session_id = 7, 8
+        self.matchmaker.seated(match, now=10)
+
+        self.join('d', at=11)
+        self.join('e', at=12)
+        [filled] = self.matchmaker.due(now=12)
+        self.assertEqual((self.channels(filled), filled.lobby_id, filled.session_id), (['d'], 7, 8))
+        self.assertEqual(len(self.matchmaker), 1)
+        self.assertNotIn((1, 4), self.matchmaker.open_lobbies)
+
+    def test_open_lobby_stops_filling_after_the_fill_window(self):
+        self.join('a')
+        self.join('b')
+        [match] = self.matchmaker.due(now=10)
+        match.lobby_id = 7
+        self.matchmaker.seated(match, now=10)
+        self.join('c', at=40)
+        self.assertEqual(self.matchmaker.due(now=40), [])
+        self.assertEqual(len(self.matchmaker), 1)
+
+    def test_players_who_leave_are_not_matched(self):
+        self.join('a', size=2)
+        self.assertTrue(self.matchmaker.leave('a'))
+        self.assertFalse(self.matchmaker.leave('a'))
+        self.join('b', size=2)
+        self.assertEqual(self.matchmaker.due(now=100), [])
+
+    def test_release_hands_over_buckets_no_longer_owned(self):
+        self.join('a', size=2)
+        self.matchmaker.join('b', 2, 2, joined_at=0)
+        moved = self.matchmaker.release(lambda bucket: bucket[0] == 1)
+        self.assertEqual([ticket.channel for ticket in moved], ['b'])
+        self.assertEqual(list(self.matchmaker.queues), [(1, 2)])
+
+    def test_unknown_lobby_size_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.join('a', size=3)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class LifespanTests(SimpleTestCase):
+    async def test_startup_runs_lobby_worker_and_matchmaking(self):
+        lifespan.start()
+        try:
+            self.assertIn(matchmaking._task, lifespan._tasks)
+            self.assertEqual(len(lifespan._tasks), 2)
+            self.assertFalse(any(task.done() for task in lifespan._tasks))
+        finally:
+            await lifespan.stop()
+        self.assertTrue(matchmaking._task.done())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PoolTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='author')
+
+    def make_questions(self, quiz, count):
+        Question.objects.bulk_create([
+            Question(quiz=quiz, text=f'Question {i}', question_type='MC', correct_answer='a') for i in range(count)
+        ])
+
+    def make_quiz(self, questions, pool_size=None):
+        quiz = Quiz.objects.create(title='Pool', creator=self.user, pool_size=pool_size)
+        self.make_questions(quiz, questions)
+        return quiz
+
+    def assert_valid_draw(self, quiz, ids, size):
+        self.assertEqual(len(ids), size)
+        self.assertEqual(len(set(ids)), size)
+        self.assertEqual(Question.objects.filter(quiz=quiz, pk__in=ids).count(), size)
+
+    def test_draw_is_deterministic_per_seed(self):
+        quiz = self.make_quiz(200)
+        first = pools.draw(quiz.pk, 10, seed=1)
+        self.assert_valid_draw(quiz, first, 10)
+        self.assertEqual(pools.draw(quiz.pk, 10, seed=1), first)
+        self.assertNotEqual(pools.draw(quiz.pk, 10, seed=2), first)
+
+    def test_sparse_pool_falls_back_to_reading_the_ids(self):
+        quiz = self.make_quiz(0)
+        other = self.make_quiz(0)
+        for _ in range(10):
+            self.make_questions(quiz, 1)
+            self.make_questions(other, 40)
+        questions = Question.objects.filter(quiz=quiz)
+        low, high = min(q.pk for q in questions), max(q.pk for q in questions)
+        self.assertIsNone(pools._probe(questions, 5, low, high, random.Random(1)))
+
+        first = pools.draw(quiz.pk, 5, seed=1)
+        self.assert_valid_draw(quiz, first, 5)
+        self.assertEqual(pools.draw(quiz.pk, 5, seed=1), first)
+
+    def test_pool_larger_than_the_quiz_plays_every_question(self):
+        quiz = self.make_quiz(3)
+        self.assertEqual(sorted(pools.draw(quiz.pk, 10, seed=1)),
+                         sorted(Question.objects.filter(quiz=quiz).values_list('id', flat=True)))
+        self.assertEqual(pools.draw(self.make_quiz(0).pk, 10, seed=1), [])
+
+    def test_attempt_replays_its_draw(self):
+        quiz = self.make_quiz(100, pool_size=5)
+        attempt = pools.start_attempt(self.user, quiz)
+        self.assertEqual(attempt.question_ids, pools.draw(quiz.pk, 5, attempt.seed))
+        Question.objects.filter(pk=attempt.question_ids[0]).delete()
+        self.assertEqual(pools.question_ids(attempt), attempt.question_ids[1:])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='author')
+        self.quiz = Quiz.objects.create(title='Volcano facts', creator=self.user, is_public=True)
+
+    def ask(self, text, quiz=None):
+        return Question.objects.create(quiz=quiz or self.quiz, text=text, question_type='MC', correct_answer='a')
+
+    def found(self, text, **kwargs):
+        results, _ = search.search(text, **kwargs)
+        return [(r['type'], r['question_id'] or r['quiz_id']) for r in results]
+
+    def test_match_query_quotes_every_word(self):
+        self.assertEqual(search.build_match_query('lava "flow'), '"lava" "flow"*')
+        self.assertEqual(search.build_match_query('title:x OR NEAR(y)'), '"title" "x" "or" "near" "y"')
+        self.assertEqual(search.build_match_query('  -*"  '), '')
+
+    def test_short_last_word_must_match_whole(self):
+        self.assertEqual(search.query_terms('Lava A'), (['lava', 'a'], False))
+        self.assertEqual(search.build_match_query('la'), '"la"*')
+        self.ask('Is Etna a volcano?')
+        self.ask('Name a lava lake')
+        self.assertEqual(len(self.found('e')), 0)
+        self.assertEqual(len(self.found('la')), 1)
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        question = self.ask('Which volcano erupted in 79 AD?')
+        self.assertEqual(self.found('volcano'), [('quiz', self.quiz.pk), ('question', question.pk)])
+        question.text = 'Which mountain erupted in 79 AD?'
+        question.save()
+        self.assertEqual(self.found('mountain'), [('question', question.pk)])
+        self.assertEqual(self.found('volcano'), [('quiz', self.quiz.pk)])
+        self.quiz.title = 'Geology'
+        self.quiz.save()
+        question.delete()
+        self.assertEqual(self.found('volcano'), [])
+        self.assertEqual(self.found('mountain'), [])
+
+    def test_private_quizzes_are_not_found(self):
+        hidden = Quiz.objects.create(title='Secret volcano', creator=self.user, is_public=False)
+        self.ask('Hidden volcano question', quiz=hidden)
+        self.assertEqual(self.found('secret'), [])
+        self.assertEqual(self.found('hidden'), [])
+
+    def test_broad_queries_get_the_newest_matches(self):
+        dense = self.ask('lava lava lava')
+        sparse = [self.ask(f'Where does the lava of volcano number {i} go after it cools down') for i in range(3)]
+        ranked = self.found('lava')
+        self.assertEqual(ranked[0], ('question', dense.pk))
+        with mock.patch.object(search, 'MAX_RANKED_MATCHES', 2):
+            newest = self.found('lava')
+        self.assertEqual(newest, [('question', q.pk) for q in [*reversed(sparse), dense]])
+
+    def test_pages(self):
+        questions = [self.ask(f'Crater question {i}') for i in range(5)]
+        first, has_next = search.search('crater', page=1, page_size=2)
+        self.assertEqual((len(first), has_next), (2, True))
+        last, has_next = search.search('crater', page=3, page_size=2)
+        self.assertEqual((len(last), has_next), (1, False))
+        seen = {r['question_id'] for page in (1, 2, 3) for r in search.search('crater', page=page, page_size=2)[0]}
+        self.assertEqual(seen, {q.pk for q in questions})
+        self.assertEqual(search.search('crater', page=search.MAX_PAGE + 1)[0], [])
+
+    def test_view_rejects_bad_pages(self):
+        self.ask('Crater question')
+        for page in ('x', '99999999999999999999'):
+            response = self.client.get('/api/search/', {'q': 'crater', 'page': page})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/search/', {'q': 'crater', 'page_size': '99999999999999999999'})
+        self.assertEqual((response.status_code, len(response.json()['results'])), (200, 1))
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import bundles, views
 from .views import game
 
 urlpatterns = [
@@ -24,5 +25,10 @@ urlpatterns = [
     path('api/quiz/attempt/<int:attempt_id>/complete/', views.CompleteQuizAttempt.as_view(), name='complete-attempt'),
     path('api/leaderboard/<int:quiz_id>/', views.LeaderboardView.as_view(), name='leaderboard'),
     path('api/daily-challenge/', views.DailyChallengeView.as_view(), name='daily-challenge'),
+    path('api/search/', views.SearchView.as_view(), name='search'),
+    path('api/metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
 
+if settings.DEBUG:
+    # in production the web server serves STATIC_ROOT/quizzes/ directly (see quiz/bundles.py)
+    urlpatterns.append(path(f'{bundles.DEV_URL_PREFIX.lstrip("/")}<str:name>', views.quiz_bundle, name='quiz-bundle'))
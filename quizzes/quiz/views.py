@@ -1,32 +1,53 @@
+from datetime import timedelta
 from rest_framework import generics, status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Quiz, Question, QuizAttempt, AttemptAnswer, LeaderboardEntry, DailyChallenge
-from .serializers import QuizSerializer, QuizAttemptSerializer, AttemptAnswerSerializer, LeaderboardEntrySerializer, DailyChallengeSerializer
+from .models import Quiz, Question, QuizAttempt, AttemptAnswer, LeaderboardEntry
+from .serializers import (QuizSerializer, QuizAttemptSerializer, AttemptAnswerSerializer, LeaderboardEntrySerializer,
+                          InstrumentationSwitchSerializer)
+from django.conf import settings
 from django.utils import timezone
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
-from django.forms import modelformset_factory
-from .forms import QuizForm, QuestionForm, BaseQuestionFormSet
-import random
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from django.views.static import serve
+from . import answers, bundles, caching, instrumentation, jobs, pools, projections, search, metrics
+from .renderers import stream_json_list
+from .routers import read_from_replica
 
 # Public quizzes
+@method_decorator(read_from_replica, name='dispatch')
 class PublicQuizList(generics.ListAPIView):
     serializer_class = QuizSerializer
 
     def get_queryset(self):
         return Quiz.objects.filter(is_public=True)
 
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream'):
+            return stream_json_list(request, caching.iter_public_quiz_payloads())
+        return Response(caching.public_quiz_payloads())
+
 # Quiz details
+@method_decorator(read_from_replica, name='dispatch')
 class QuizDetail(generics.RetrieveAPIView):
     queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        payload = caching.quiz_payload(self.kwargs['pk'])
+        if payload is None:
+            raise Http404
+        return Response(payload)
+
 # Start a quiz attempt
 class StartQuizAttempt(APIView):
     def post(self, request, quiz_id):
         quiz = get_object_or_404(Quiz, pk=quiz_id)
-        attempt = QuizAttempt.objects.create(user=request.user, quiz=quiz)
+        attempt = pools.start_attempt(request.user, quiz)
         serializer = QuizAttemptSerializer(attempt)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -34,21 +55,17 @@ class StartQuizAttempt(APIView):
 class SubmitAnswer(APIView):
     def post(self, request, attempt_id, question_id):
         attempt = get_object_or_404(QuizAttempt, pk=attempt_id)
-        question = get_object_or_404(Question, pk=question_id)
+        if attempt.question_ids is not None and question_id not in attempt.question_ids:
+            return Response({'detail': "This question is not part of the attempt's draw."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        correct_answer = caching.answer_key(attempt.quiz_id).get(question_id)
+        if correct_answer is None:
+            correct_answer = get_object_or_404(Question, pk=question_id).correct_answer.strip().lower()
         selected_answer = request.data.get('selected_answer')
 
-        is_correct = selected_answer.strip().lower() == question.correct_answer.strip().lower()
-        answer_obj = AttemptAnswer.objects.create(
-            attempt=attempt,
-            question=question,
-            selected_answer=selected_answer,
-            is_correct=is_correct
-        )
-
-        # Update score
-        if is_correct:
-            attempt.score += 1
-            attempt.save()
+        is_correct = selected_answer.strip().lower() == correct_answer
+        # Store the answer and update score
+        answer_obj = answers.record_answer(attempt, question_id, selected_answer, is_correct)
 
         serializer = AttemptAnswerSerializer(answer_obj)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -57,6 +74,8 @@ class SubmitAnswer(APIView):
 class CompleteQuizAttempt(APIView):
     def post(self, request, attempt_id):
         attempt = get_object_or_404(QuizAttempt, pk=attempt_id)
+        # answers may still be in the answer log, so count them rather than trusting the stored score
+        attempt.score = answers.attempt_score(attempt.id)
         attempt.completed_at = timezone.now()
         # Optional: calculate time taken
         if attempt.started_at:
@@ -74,6 +93,7 @@ class CompleteQuizAttempt(APIView):
         return Response({'status': 'completed', 'score': attempt.score})
 
 # Leaderboard
+@method_decorator(read_from_replica, name='dispatch')
 class LeaderboardView(generics.ListAPIView):
     serializer_class = LeaderboardEntrySerializer
 
@@ -81,13 +101,65 @@ class LeaderboardView(generics.ListAPIView):
         quiz_id = self.kwargs['quiz_id']
         return LeaderboardEntry.objects.filter(quiz_id=quiz_id).order_by('-score', 'time_taken_seconds')
 
+    def list(self, request, *args, **kwargs):
+        # ?stream=1 reads a long leaderboard straight from the database instead of building it in memory
+        if request.query_params.get('stream'):
+            return stream_json_list(request, projections.leaderboard_rows(self.kwargs['quiz_id'], chunk_size=2000))
+        return Response(caching.leaderboard(self.kwargs['quiz_id']))
+
 # Daily challenge
+@method_decorator(read_from_replica, name='dispatch')
 class DailyChallengeView(APIView):
     def get(self, request):
-        today = timezone.localdate()
-        challenge = DailyChallenge.objects.filter(date=today).first()
-        serializer = DailyChallengeSerializer(challenge)
-        return Response(serializer.data)
+        return Response(caching.daily_challenge(timezone.localdate()))
+
+# Full-text search over public quizzes and questions
+class SearchView(APIView):
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            page = int(request.query_params.get('page', 1))
+            page_size = int(request.query_params.get('page_size', search.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return Response({'detail': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if page > search.MAX_PAGE:
+            return Response({'detail': f'page must be at most {search.MAX_PAGE}'}, status=status.HTTP_400_BAD_REQUEST)
+        results, has_next = search.search(query, page=page, page_size=page_size)
+        return Response({'query': query, 'page': max(page, 1), 'has_next': has_next, 'results': results})
+
+# Per-process metrics: lobby frame counters, HTTP/WebSocket timing histograms, loop lag.
+# Staff only: profiles include stack traces. A POST switches instrumentation in the worker
+# process that handles it only; set CHANNELS_INSTRUMENTATION to switch every worker.
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        data = metrics.snapshot()
+        data['instrumentation'] = dict(instrumentation.state)
+        # background jobs run in `manage.py run_jobs`, so their timings come from the Job rows
+        data['jobs'] = jobs.stats(since=timezone.now() - timedelta(hours=1))
+        if request.query_params.get('profile'):
+            data['slowest_messages'] = instrumentation.profiler.dump()
+        return Response(data)
+
+    def post(self, request):
+        serializer = InstrumentationSwitchSerializer(data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        switches = serializer.validated_data
+        state = instrumentation.set_enabled(switches.get('enabled'), switches.get('profile'))
+        if switches.get('reset'):
+            metrics.reset()
+            instrumentation.profiler.clear()
+        return Response({'instrumentation': state})
+
+def quiz_bundle(request, name):
+    """Development stand-in for the web server: serves quiz bundles with their production cache headers."""
+    response = serve(request, name, document_root=bundles.bundle_dir())
+    if bundles.BUNDLE_RE.match(name):
+        response['Cache-Control'] = bundles.IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = bundles.CATALOGUE_CACHE_CONTROL
+    return response
 
 def home(request):
     return render(request, 'home.html')
@@ -97,25 +169,31 @@ def game(request):
     return render(request, 'game.html', {'question': question})
 
 def create_quiz(request):
+    # forms are only needed on this rarely used page, so keep them out of worker startup
+    from django.forms import modelformset_factory
+    from .forms import QuizForm, QuestionForm, BaseQuestionFormSet
+
     QuestionFormSet = modelformset_factory(Question, form=QuestionForm, extra=3, formset=BaseQuestionFormSet)
     if request.method == "POST":
         quiz_form = QuizForm(request.POST)
         formset = QuestionFormSet(request.POST, queryset=Question.objects.none())
         if quiz_form.is_valid() and formset.is_valid():
-            quiz = quiz_form.save(commit=False)  # don't save yet
-            # assign a guest user
-            User = get_user_model()
-            guest, created = User.objects.get_or_create(username="guest")
-            quiz.creator = guest
-            quiz.save()  # now save the quiz
-
-            for form in formset:
-                # skip empty forms
-                if not form.cleaned_data or form.cleaned_data.get('DELETE', False):
-                    continue
-                question = form.save(commit=False)
-                question.quiz = quiz
-                question.save()
+            # one transaction, so the quiz bundle is published once with all its questions
+            with transaction.atomic():
+                quiz = quiz_form.save(commit=False)  # don't save yet
+                # assign a guest user
+                User = get_user_model()
+                guest, created = User.objects.get_or_create(username="guest")
+                quiz.creator = guest
+                quiz.save()  # now save the quiz
+
+                for form in formset:
+                    # skip empty forms
+                    if not form.cleaned_data or form.cleaned_data.get('DELETE', False):
+                        continue
+                    question = form.save(commit=False)
+                    question.quiz = quiz
+                    question.save()
 
             return redirect('quizzes')  # changed from 'quizzes-list' to 'quizzes'
     else:
@@ -125,8 +203,14 @@ def create_quiz(request):
 
     return render(request, 'create_quiz.html', {'quiz_form': quiz_form, 'formset': formset})
 
+@read_from_replica
 def quizzes_list(request):
-    quizzes = Quiz.objects.filter(is_public=True)
+    # the published catalogue (see quiz/bundles.py) when there is one, so browsing skips the database
+    catalogue = bundles.read_catalogue() if settings.QUIZ_BUNDLES_AUTO_PUBLISH else None
+    if catalogue is not None:
+        quizzes = list(catalogue.values())
+    else:
+        quizzes = Quiz.objects.filter(is_public=True)
     return render(request, 'quizzes.html', {'quizzes': quizzes})
 
 
@@ -153,7 +237,7 @@ def quiz_game(request, quiz_id):
 
     # Handle a retake request early: create a fresh attempt and start over
     if request.method == 'POST' and request.POST.get('retake'):
-        new_attempt = QuizAttempt.objects.create(user=user, quiz=quiz)
+        new_attempt = pools.start_attempt(user, quiz)
         session_key = f'quiz_{quiz_id}_attempt_id'
         request.session[session_key] = new_attempt.id
         return redirect('quiz-game', quiz_id=quiz_id)
@@ -167,36 +251,32 @@ def quiz_game(request, quiz_id):
             attempt = None
 
     if attempt is None:
-        attempt = QuizAttempt.objects.create(user=user, quiz=quiz)
+        attempt = pools.start_attempt(user, quiz)
         request.session[session_key] = attempt.id
 
-    # helper: ordered list of questions in quiz
-    try:
-        questions_qs = quiz.questions.all()
-    except Exception:
-        questions_qs = quiz.question_set.all()
-    questions = list(questions_qs.order_by('id'))
-    q_total = len(questions)
+    # ids of the questions this attempt plays, in order (a drawn subset in pool mode);
+    # only the question being shown is loaded
+    question_ids = pools.question_ids(attempt)
+    positions = {qid: index for index, qid in enumerate(question_ids)}
+    q_total = len(question_ids)
+
+    # answers given so far, including any still waiting in the answer log
+    answered = answers.attempt_answers(attempt.id)
 
     # get target question id via query param or pick first unanswered
     requested_qid = request.GET.get('q')
-    current_question = None
-    if requested_qid:
-        current_question = next((q for q in questions if str(q.id) == str(requested_qid)), None)
-
-    # find next unanswered if no requested or requested invalid
-    if not current_question:
-        answered_qids = AttemptAnswer.objects.filter(attempt=attempt).values_list('question_id', flat=True)
-        for q in questions:
-            if q.id not in answered_qids:
-                current_question = q
-                break
+    current_id = int(requested_qid) if requested_qid and requested_qid.isdigit() else None
+    if current_id not in positions:
+        # find next unanswered if no requested or requested invalid
+        answered_qids = {qid for qid, _ in answered}
+        current_id = next((qid for qid in question_ids if qid not in answered_qids), None)
+    current_question = Question.objects.filter(pk=current_id).first() if current_id is not None else None
 
     # if still no question -> completed
     if not current_question:
         # compute final stats
-        total = AttemptAnswer.objects.filter(attempt=attempt).count()
-        correct = AttemptAnswer.objects.filter(attempt=attempt, is_correct=True).count()
+        total = len(answered)
+        correct = sum(1 for _, ok in answered if ok)
         accuracy = (correct / total * 100) if total > 0 else 0
         return render(request, 'game.html', {
             'quiz': quiz,
@@ -209,65 +289,50 @@ def quiz_game(request, quiz_id):
         })
 
     # compute current question index (1-based)
-    try:
-        q_index = questions.index(current_question)
-        q_number = q_index + 1
-    except ValueError:
-        q_number = None
+    q_number = positions[current_question.id] + 1
 
     # Handle POST (user answered current question)
     if request.method == 'POST':
         # normal answer submission
         selected = request.POST.get('answer')
         qid = request.POST.get('question_id')
-        try:
-            qobj = next((q for q in questions if str(q.id) == str(qid)), None)
-        except Exception:
+        if str(qid) == str(current_question.id):
             qobj = current_question
+        elif qid and str(qid).isdigit() and int(qid) in positions:
+            qobj = Question.objects.filter(pk=int(qid)).first()
+        else:
+            qobj = None
 
         # determine correctness (safe compare)
         is_correct = False
         if qobj and selected is not None:
             # guard: if this question was already answered in this attempt, skip creating a duplicate
-            already_answered = AttemptAnswer.objects.filter(attempt=attempt, question=qobj).exists()
-            if not already_answered:
+            previous = [ok for qid, ok in answered if qid == qobj.id]
+            if not previous:
                 correct_text = (qobj.correct_answer or '').strip().lower()
                 is_correct = selected.strip().lower() == correct_text
 
-                # create AttemptAnswer record
-                AttemptAnswer.objects.create(
-                    attempt=attempt,
-                    question=qobj,
-                    selected_answer=selected,
-                    is_correct=is_correct
-                )
-
-                # update attempt score
-                if is_correct:
-                    attempt.score = (attempt.score or 0) + 1
-                    attempt.save()
+                # store the answer and update attempt score
+                answers.record_answer(attempt, qobj.id, selected, is_correct)
+                answered.append((qobj.id, is_correct))
             else:
                 # if already answered, recompute correctness based on existing record
-                prev = AttemptAnswer.objects.filter(attempt=attempt, question=qobj).last()
-                is_correct = prev.is_correct if prev else False
+                is_correct = previous[-1]
 
         # compute accuracy so far
-        total = AttemptAnswer.objects.filter(attempt=attempt).count()
-        correct = AttemptAnswer.objects.filter(attempt=attempt, is_correct=True).count()
+        total = len(answered)
+        correct = sum(1 for _, ok in answered if ok)
         accuracy = (correct / total * 100) if total > 0 else 0
 
         # pick next question id
-        answered_qids = AttemptAnswer.objects.filter(attempt=attempt).values_list('question_id', flat=True)
-        next_question = None
-        for q in questions:
-            if q.id not in answered_qids:
-                next_question = q
-                break
+        answered_qids = {qid for qid, _ in answered}
+        next_question_id = next((qid for qid in question_ids if qid not in answered_qids), None)
 
         # If there is no next question, finalize the attempt immediately and redirect to completion view
-        if not next_question:
+        if next_question_id is None:
             # only mark completed once
             was_completed = bool(attempt.completed_at)
+            attempt.score = correct
             attempt.completed_at = timezone.now()
             if attempt.started_at and not attempt.time_taken_seconds:
                 attempt.time_taken_seconds = int((attempt.completed_at - attempt.started_at).total_seconds())
@@ -295,7 +360,7 @@ def quiz_game(request, quiz_id):
                 'correct': qobj.correct_answer if qobj else None
             },
             'accuracy': round(accuracy, 2),
-            'next_question_id': next_question.id if next_question else None,
+            'next_question_id': next_question_id,
             'redirect_after_seconds': 2,
             'attempt': attempt,
             'has_taken': has_taken,
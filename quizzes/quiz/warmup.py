@@ -0,0 +1,99 @@
+import logging
+import pickle
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+from . import caching
+from .models import Quiz, QuizAttempt
+
+logger = logging.getLogger(__name__)
+
+
+class Budget:
+    """Stops the warm-up once it has spent its time or (estimated, pickled) memory allowance."""
+
+    def __init__(self, seconds, max_bytes):
+        self.deadline = time.perf_counter() + seconds if seconds else None
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+    def spend(self, value):
+        self.bytes += len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @property
+    def exhausted(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return True
+        return bool(self.max_bytes) and self.bytes >= self.max_bytes
+
+
+def warm(time_budget=None, memory_budget=None, leaderboards=None):
+    """Preload today's challenge, public quiz payloads and answer keys, then the busiest leaderboards.
+
+    Work is done in that order and stops as soon as either budget runs out. Returns a report dict.
+    """
+    time_budget = settings.CACHE_WARMUP_TIME_BUDGET if time_budget is None else time_budget
+    memory_budget = settings.CACHE_WARMUP_MEMORY_BUDGET if memory_budget is None else memory_budget
+    leaderboards = settings.CACHE_WARMUP_LEADERBOARDS if leaderboards is None else leaderboards
+
+    started = time.perf_counter()
+    budget = Budget(time_budget, memory_budget)
+    report = {'daily_challenge': 0, 'quizzes': 0, 'answer_keys': 0, 'leaderboards': 0}
+    timeout = settings.QUIZ_CACHE_TIMEOUT
+
+    today = timezone.localdate()
+    daily = caching.build_daily_challenge(today)
+    cache.set(caching.daily_key(today), daily, timeout)
+    budget.spend(daily)
+    report['daily_challenge'] = 1
+
+    # newest first: recently created quizzes are the ones players are browsing
+    quiz_ids = list(Quiz.objects.filter(is_public=True).order_by('-created_at').values_list('id', flat=True))
+    batch_size = 100
+    for offset in range(0, len(quiz_ids), batch_size):
+        if budget.exhausted:
+            break
+        payloads, keys = {}, {}
+        for quiz_id, payload in caching.build_quiz_payloads(quiz_ids[offset:offset + batch_size]).items():
+            # the payload already holds the questions, so the answer key comes for free
+            answers = {q['id']: (q['correct_answer'] or '').strip().lower() for q in payload['questions']}
+            payloads[caching.quiz_key(quiz_id)] = payload
+            keys[caching.answers_key(quiz_id)] = answers
+            budget.spend(payload)
+            budget.spend(answers)
+        cache.set_many(payloads, timeout)
+        cache.set_many(keys, timeout)
+        report['quizzes'] += len(payloads)
+        report['answer_keys'] += len(keys)
+
+    busiest = (
+        QuizAttempt.objects.values('quiz_id').annotate(plays=Count('id')).order_by('-plays')
+        .values_list('quiz_id', flat=True)[:leaderboards]
+    )
+    for quiz_id in busiest:
+        if budget.exhausted:
+            break
+        data = caching.build_leaderboard(quiz_id)
+        cache.set(caching.leaderboard_key(quiz_id), data, timeout)
+        budget.spend(data)
+        report['leaderboards'] += 1
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['bytes'] = budget.bytes
+    report['budget_exhausted'] = budget.exhausted
+    return report
+
+
+def on_startup(started):
+    """Called at the end of asgi.py/wsgi.py with the perf_counter() taken before Django was imported."""
+    logger.info('worker imports and app setup took %.3fs', time.perf_counter() - started)
+    if settings.CACHE_WARMUP_ON_STARTUP:
+        try:
+            report = warm()
+        except Exception:
+            # a cold cache is slower, not broken; never keep the worker from starting
+            logger.exception('cache warm-up failed')
+        else:
+            logger.info('cache warm-up: %s', report)
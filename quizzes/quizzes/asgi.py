@@ -1,11 +1,22 @@
 import os
-from channels.routing import get_default_application
+import time
+
+started = time.perf_counter()
+
 from django.core.asgi import get_asgi_application
-from .routing import application as channels_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quizzes.settings')
 
+# set up Django before importing the routing, which imports the consumers and models
 django_asgi_app = get_asgi_application()
 
-# Final ASGI app: HTTP requests go to Django, WebSocket requests go to Channels
-application = channels_application
+from .routing import application as channels_application  # noqa: E402
+from quiz.lifespan import LifespanMiddleware, start_when_loop_runs  # noqa: E402
+from quiz.warmup import on_startup  # noqa: E402
+
+# Final ASGI app: HTTP requests go to Django, WebSocket requests go to Channels;
+# lifespan events start the per-process lobby listener (see quiz/lifespan.py)
+application = LifespanMiddleware(channels_application)
+
+on_startup(started)
+start_when_loop_runs()
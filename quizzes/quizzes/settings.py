@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Base directory
@@ -23,6 +24,7 @@ INSTALLED_APPS = [
 
 # Middleware
 MIDDLEWARE = [
+    'quiz.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,11 +62,86 @@ DATABASES = {
     }
 }
 
+# Read replicas: comma-separated SQLite files in DATABASE_REPLICAS, e.g. replica1.sqlite3,replica2.sqlite3.
+# Only read-only endpoints use them (see quiz/routers.py); locally, refresh them with `manage.py sync_replicas`.
+DATABASE_REPLICAS = []
+for i, name in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(','))):
+    alias = f'replica{i + 1}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['quiz.routers.ReplicaRouter']
+
+# Cache for quiz payloads, answer keys, leaderboards and the daily challenge (see quiz/caching.py).
+# It must be shared by every worker process: entries are dropped only by the process that saved
+# the rows. Files on this host by default, Redis when CACHE_REDIS_URL is set (several hosts).
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+QUIZ_CACHE_TIMEOUT = 60 * 60
+
+# warm on worker startup too; with a shared cache `manage.py warm_cache` once per deploy is enough
+CACHE_WARMUP_ON_STARTUP = os.environ.get('CACHE_WARMUP_ON_STARTUP', '') == '1'
+CACHE_WARMUP_TIME_BUDGET = 10.0  # seconds
+CACHE_WARMUP_MEMORY_BUDGET = 64 * 1024 * 1024  # bytes, estimated from pickled size
+CACHE_WARMUP_LEADERBOARDS = 50  # leaderboards of the most played quizzes
+
+# the quiz app's own log lines, e.g. worker startup and cache warm-up timings (see quiz/warmup.py)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'quiz': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# JSON via orjson when it is installed (see quiz/renderers.py); same output as DRF's JSONRenderer
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'quiz.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 # Static files
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Content-hashed quiz bundles under STATIC_ROOT/quizzes/ (see quiz/bundles.py)
+QUIZ_BUNDLES_AUTO_PUBLISH = True
+QUIZ_BUNDLES_PUBLISH_IN_BACKGROUND = False  # publish from `manage.py run_jobs` instead of the request
+
+# Background jobs (see quiz/jobs.py and quiz/tasks.py), run by `manage.py run_jobs`
+JOB_WORKERS = 4  # threads (or processes with --processes) per run_jobs
+JOB_POLL_INTERVAL = 1.0  # seconds between looks for due jobs when idle
+JOB_HEARTBEAT_INTERVAL = 30  # seconds between "still running" updates for a worker's jobs
+JOB_LEASE_SECONDS = 5 * 60  # a job without a heartbeat for this long is assumed lost with its worker and retried
+JOB_SCHEDULES = {
+    # name: {'job': registered job, 'every': seconds, 'kwargs': {...}}
+    'daily-challenge': {'job': 'create_daily_challenge', 'every': 15 * 60},
+    'prune-jobs': {'job': 'prune_jobs', 'every': 24 * 60 * 60, 'kwargs': {'days': 7}},
+}
+
 # Channels
 ASGI_APPLICATION = "quizzes.routing.application"
 
@@ -77,6 +154,41 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Lobby sharding: every ASGI worker process that serves lobby sockets, and this process's name.
+# Lobby ids are assigned to workers on a consistent hash ring (see quiz/sharding.py).
+LOBBY_WORKERS = os.environ.get('LOBBY_WORKERS', 'default').split(',')
+LOBBY_WORKER_NAME = os.environ.get('LOBBY_WORKER_NAME', 'default')
+
+# Per-connection limits for lobby sockets (see quiz/backpressure.py)
+LOBBY_RATE_LIMIT = 10  # inbound frames per second
+LOBBY_RATE_BURST = 20
+LOBBY_MAX_MESSAGE_BYTES = 4096
+LOBBY_OUTBOX_SIZE = 64  # queued outbound frames before the oldest is dropped
+
+# Matchmaking for public lobbies over ws/matchmaking/ (see quiz/matchmaking.py)
+MATCHMAKING_LOBBY_SIZES = (2, 4, 8)
+MATCHMAKING_MIN_PLAYERS = 2  # smallest lobby started once a player has waited MATCHMAKING_MAX_WAIT
+MATCHMAKING_MAX_WAIT = 10.0  # seconds
+MATCHMAKING_FILL_SECONDS = 30.0  # how long later joiners may fill a lobby that started with free seats
+MATCHMAKING_INTERVAL = 0.1  # seconds between matching passes
+
+# Append-only answer log (see quiz/answer_log.py). When enabled, answers are acknowledged
+# after a log append and `manage.py project_answers` (or the project-answers job) applies them to the tables.
+ANSWER_LOG_ENABLED = os.environ.get('ANSWER_LOG', '') == '1'
+ANSWER_LOG_DIR = BASE_DIR / 'answer_log'
+ANSWER_LOG_SEGMENT_BYTES = 16 * 1024 * 1024
+ANSWER_LOG_FSYNC = True
+ANSWER_LOG_FSYNC_INTERVAL = 0  # extra seconds to gather appends into one fsync
+if ANSWER_LOG_ENABLED:
+    JOB_SCHEDULES['project-answers'] = {'job': 'project_answer_log', 'every': 5}
+
+# Timing metrics for HTTP views and lobby sockets, served to staff at /api/metrics/ and switchable
+# at runtime with a staff POST to the same URL, in the worker process that handles the POST only
+# (see quiz/instrumentation.py)
+CHANNELS_INSTRUMENTATION = os.environ.get('CHANNELS_INSTRUMENTATION', '') == '1'
+CHANNELS_PROFILING = False  # sample stacks of the slowest lobby messages
+CHANNELS_LOOP_LAG_INTERVAL = 0.5  # seconds between event-loop lag probes
+
 # Default auto field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
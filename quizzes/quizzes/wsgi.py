@@ -8,9 +8,16 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/wsgi/
 """
 
 import os
+import time
+
+started = time.perf_counter()
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quizzes.settings')
 
 application = get_wsgi_application()
+
+from quiz.warmup import on_startup  # noqa: E402
+
+on_startup(started)